@@ -0,0 +1,105 @@
+"""
+Check that starting buckup stays fast.
+
+    python benchmarks/import_time.py [--max-ms 100] [--runs 5]
+
+Imports ``buckup.command_line`` under ``python -X importtime`` and fails if
+boto3 or botocore are imported before an AWS call is needed, or if the
+cumulative import time of the fastest run goes over ``--max-ms``. It also
+reports the wall time of ``buckup --version``.
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("boto3", "botocore", "s3transfer")
+
+VERSION_SCRIPT = """
+import sys
+from buckup.command_line import main
+sys.argv = ["buckup", "--version"]
+try:
+    main()
+except SystemExit:
+    pass
+heavy = sorted(
+    name for name in sys.modules if name.split(".")[0] in {heavy_modules!r}
+)
+if heavy:
+    sys.exit("Imported by --version: " + ", ".join(heavy))
+""".format(heavy_modules=HEAVY_MODULES)
+
+
+def measure_import():
+    """
+    Return the cumulative import time of ``buckup.command_line`` in
+    milliseconds and the names of every module it imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import buckup.command_line"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = None
+    modules = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        modules.append(name)
+        if name == "buckup.command_line":
+            cumulative = int(cumulative_us) / 1000
+    return cumulative, modules
+
+
+def measure_version():
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", VERSION_SCRIPT], capture_output=True, text=True
+    )
+    duration = (time.perf_counter() - start) * 1000
+    return duration, process
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-ms", type=float, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    results = [measure_import() for _ in range(args.runs)]
+    import_ms = min(cumulative for cumulative, _ in results)
+    heavy = sorted(
+        {
+            name
+            for _, modules in results
+            for name in modules
+            if name.split(".")[0] in HEAVY_MODULES
+        }
+    )
+    print("import buckup.command_line: {:.1f}ms".format(import_ms))
+    if heavy:
+        failed = True
+        print("Imported at startup: {}".format(", ".join(heavy)))
+    if import_ms > args.max_ms:
+        failed = True
+        print("Import time is over the {:.0f}ms limit.".format(args.max_ms))
+
+    version_ms, process = min(
+        (measure_version() for _ in range(args.runs)), key=lambda result: result[0]
+    )
+    print("buckup --version: {:.1f}ms".format(version_ms))
+    if process.returncode:
+        failed = True
+        print(process.stderr.strip())
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+Measure end-to-end provisioning latency offline.
+
+    python benchmarks/provisioning.py [--mode commit|cli|batch] [--runs 5]
+        [--latency-ms 50] [--user-propagation 3] [--bucket-propagation 1]
+        [--iam-rate 10] [--no-rate-limit]
+
+Runs ``BucketCreator.commit()``, the interactive flow or ``buckup apply``
+against moto's in-process S3 and IAM (``pip install moto``). Every API call
+can be delayed by ``--latency-ms`` to stand in for network round trips, and
+AWS eventual consistency is simulated: a new bucket is not found by
+HeadBucket, and a new user is neither found by GetUser nor accepted as a
+policy principal, until the given number of seconds after its creation.
+With ``--iam-rate``, IAM calls beyond that many per second are throttled,
+and ``--no-rate-limit`` turns off buckup's own rate limiting to compare.
+
+Reports the wall time, the time spent in each step and in waits, the number
+of retries and throttled calls and the number of AWS API calls per operation.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from botocore.awsrequest import AWSResponse
+
+from buckup import ratelimit
+from buckup.batch import BatchProvisioner, build_spec
+from buckup.bucket_creator import USER_NAME_FORMAT, BucketCreator
+from buckup.command_line import BuckupCommandLineInterface
+from buckup.retry import RetryPolicy
+from buckup.tracing import Tracer
+
+REGION = "eu-west-2"
+
+
+THROTTLING_RESPONSE = (
+    b"<ErrorResponse><Error><Type>Sender</Type><Code>Throttling</Code>"
+    b"<Message>Rate exceeded</Message></Error>"
+    b"<RequestId>simulated</RequestId></ErrorResponse>"
+)
+
+
+class RawResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class SimulatedAWS:
+    """
+    Add latency, eventual consistency and IAM throttling to the calls of a
+    boto3 session.
+    """
+
+    def __init__(
+        self, latency=0, bucket_propagation=0, user_propagation=0, iam_rate=None
+    ):
+        self.latency = latency
+        self.bucket_propagation = bucket_propagation
+        self.user_propagation = user_propagation
+        self.iam_rate = iam_rate
+        self.iam_calls = []
+        self.throttled = 0
+        self.buckets = {}
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def attach(self, session):
+        # Every attempt is counted, including botocore's own retries.
+        session.events.register_first("before-send.iam", self.before_send_iam)
+        session.events.register("before-parameter-build", self.before_parameter_build)
+        session.events.register("before-call", self.before_call)
+        session.events.register("after-call", self.after_call)
+
+    def is_propagating(self, created, name, delay):
+        with self.lock:
+            created_at = created.get(name)
+        return created_at is not None and time.monotonic() - created_at < delay
+
+    def error(self, status_code, code, message):
+        return (
+            AWSResponse("https://simulated", status_code, {}, None),
+            {
+                "Error": {"Code": code, "Message": message},
+                "ResponseMetadata": {"HTTPStatusCode": status_code},
+            },
+        )
+
+    def before_send_iam(self, request, **kwargs):
+        if not self.iam_rate:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.iam_calls = [t for t in self.iam_calls if now - t < 1]
+            if len(self.iam_calls) >= self.iam_rate:
+                self.throttled += 1
+                request.buckup_benchmark_throttled = True
+                return AWSResponse(
+                    request.url, 400, {}, RawResponse(THROTTLING_RESPONSE)
+                )
+            self.iam_calls.append(now)
+
+    def before_parameter_build(self, params, context, **kwargs):
+        context["buckup_benchmark_params"] = params
+
+    def before_call(self, model, context, **kwargs):
+        params = context["buckup_benchmark_params"]
+        if self.latency:
+            time.sleep(self.latency)
+        operation = model.name
+        if operation == "HeadBucket" and self.is_propagating(
+            self.buckets, params["Bucket"], self.bucket_propagation
+        ):
+            return self.error(404, "404", "Not Found")
+        if operation == "GetUser" and self.is_propagating(
+            self.users, params.get("UserName"), self.user_propagation
+        ):
+            return self.error(404, "NoSuchEntity", "User not found")
+        if operation == "PutBucketPolicy":
+            for statement in json.loads(params["Policy"])["Statement"]:
+                principal = statement["Principal"]
+                if not isinstance(principal, dict):
+                    continue
+                user_name = principal["AWS"].rsplit("/", 1)[-1]
+                if self.is_propagating(self.users, user_name, self.user_propagation):
+                    return self.error(
+                        400, "MalformedPolicy", "Invalid principal in policy"
+                    )
+
+    def after_call(self, model, parsed, context, **kwargs):
+        params = context.get("buckup_benchmark_params", {})
+        if "Error" in parsed:
+            return
+        with self.lock:
+            if model.name == "CreateBucket":
+                self.buckets[params["Bucket"]] = time.monotonic()
+            elif model.name == "CreateUser":
+                self.users[params["UserName"]] = time.monotonic()
+
+
+class BenchmarkTracer(Tracer):
+    def __init__(self, simulation):
+        super().__init__()
+        self.simulation = simulation
+
+    def attach(self, session):
+        # Trace first so simulated responses are recorded like real ones.
+        super().attach(session)
+        self.simulation.attach(session)
+
+
+class ScriptedCommandLineInterface(BuckupCommandLineInterface):
+    def __init__(self, answers, **kwargs):
+        super().__init__(**kwargs)
+        self.answers = iter(answers)
+
+    def ask(self, question):
+        return next(self.answers)
+
+
+def get_spec(bucket_name):
+    return build_spec(
+        {
+            "bucket_name": bucket_name,
+            "cors_origins": ["https://example.com"],
+            "public_get_object_paths": ["documents/*"],
+            "enable_versioning": True,
+        },
+        region=REGION,
+    )
+
+
+def new_bucket_name():
+    return "buckup-benchmark-{}".format(uuid.uuid4().hex[:12])
+
+
+def run_commit(tracer, retry_policy, args):
+    BucketCreator(
+        region_name=REGION, quiet=True, retry_policy=retry_policy, tracer=tracer
+    ).commit(get_spec(new_bucket_name()))
+
+
+def run_cli(tracer, retry_policy, args):
+    bucket_name = new_bucket_name()
+    cli = ScriptedCommandLineInterface(
+        [
+            bucket_name,
+            USER_NAME_FORMAT.format(bucket_name=bucket_name),
+            "y",
+            "y",
+            "documents/*",
+            "n",
+            "https://example.com",
+            "y",
+        ],
+        boto3_region=REGION,
+        retry_policy=retry_policy,
+        tracer=tracer,
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        cli.execute()
+
+
+def run_batch(tracer, retry_policy, args):
+    provisioner = BatchProvisioner(
+        region_name=REGION,
+        max_workers=args.concurrency,
+        retry_policy=retry_policy,
+        tracer=tracer,
+    )
+    specs = [get_spec(new_bucket_name()) for _ in range(args.batch_size)]
+    for result in provisioner.run(specs):
+        if not result.ok:
+            raise result.error
+
+
+MODES = {"commit": run_commit, "cli": run_cli, "batch": run_batch}
+
+
+def summarise(tracer, wall_time):
+    spans = tracer.as_json()["spans"]
+    steps = defaultdict(float)
+    waits = defaultdict(float)
+    retries = 0
+    api_calls = Counter()
+    for span in spans:
+        if span["category"] == "step":
+            steps[span["name"]] += span["duration"]
+        elif span["category"] == "wait":
+            waits[span["name"]] += span["duration"]
+            retries += span["attributes"].get("retries", 0)
+        elif span["category"] == "api":
+            api_calls[span["name"]] += 1
+    return {
+        "wall_time": wall_time,
+        "steps": dict(steps),
+        "waits": dict(waits),
+        "retries": retries,
+        "throttled": tracer.simulation.throttled,
+        "api_calls": dict(api_calls),
+    }
+
+
+def print_report(runs):
+    def median(values):
+        return statistics.median(values) if values else 0
+
+    print("runs: {}".format(len(runs)))
+    print("wall time: {:.3f}s (median)".format(median([r["wall_time"] for r in runs])))
+    for section in ("steps", "waits"):
+        names = sorted({name for run in runs for name in run[section]})
+        for name in names:
+            print(
+                "{section} {name}: {duration:.3f}s".format(
+                    section=section[:-1],
+                    name=name,
+                    duration=median([run[section].get(name, 0) for run in runs]),
+                )
+            )
+    print("retries: {}".format(median([run["retries"] for run in runs])))
+    print("throttled: {}".format(median([run["throttled"] for run in runs])))
+    operations = sorted({name for run in runs for name in run["api_calls"]})
+    print(
+        "api calls: {}".format(median([sum(run["api_calls"].values()) for run in runs]))
+    )
+    for name in operations:
+        print(
+            "  {name}: {count}".format(
+                name=name,
+                count=median([run["api_calls"].get(name, 0) for run in runs]),
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=sorted(MODES), default="commit")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--bucket-propagation", type=float, default=0)
+    parser.add_argument("--user-propagation", type=float, default=0)
+    parser.add_argument("--iam-rate", type=float, default=0)
+    parser.add_argument("--no-rate-limit", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--initial-delay", type=float, default=0.5)
+    parser.add_argument("--max-delay", type=float, default=10)
+    parser.add_argument(
+        "--json", action="store_true", help="Print the raw results as JSON."
+    )
+    args = parser.parse_args()
+
+    try:
+        from moto import mock_aws
+        from moto.core.botocore_stubber import BotocoreStubber
+    except ImportError:
+        sys.exit('moto is required to run this benchmark: "pip install moto".')
+
+    # moto handles every request sent, even those answered by a simulated
+    # throttling error, which must not reach it.
+    stub = BotocoreStubber.__call__
+
+    def stub_unless_throttled(self, event_name, request, **kwargs):
+        if getattr(request, "buckup_benchmark_throttled", False):
+            return None
+        return stub(self, event_name, request, **kwargs)
+
+    BotocoreStubber.__call__ = stub_unless_throttled
+
+    os.environ.update(
+        {
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "AWS_DEFAULT_REGION": REGION,
+        }
+    )
+    os.environ.pop("AWS_PROFILE", None)
+    if args.no_rate_limit:
+        ratelimit.DEFAULT_RATES.clear()
+
+    runs = []
+    with mock_aws():
+        for _ in range(args.runs):
+            simulation = SimulatedAWS(
+                latency=args.latency_ms / 1000,
+                bucket_propagation=args.bucket_propagation,
+                user_propagation=args.user_propagation,
+                iam_rate=args.iam_rate,
+            )
+            tracer = BenchmarkTracer(simulation)
+            retry_policy = RetryPolicy(
+                initial_delay=args.initial_delay, max_delay=args.max_delay
+            )
+            start = time.perf_counter()
+            MODES[args.mode](tracer, retry_policy, args)
+            runs.append(summarise(tracer, time.perf_counter() - start))
+
+    if args.json:
+        print(json.dumps(runs, indent=2))
+    else:
+        print_report(runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .exceptions import CannotGetCurrentUser, CannotListAccountAliases
+from .utils import get_cache_dir
+
+# The identity and alias behind a set of credentials almost never change.
+DEFAULT_TTL = 24 * 3600
+
+
+def get_credentials_key(profile_name=None):
+    """
+    Name the credentials botocore will use, without reading them: the
+    profile, resolved like botocore does, and the access key ID set in the
+    environment, which takes precedence over the profile's.
+    """
+    key = (
+        profile_name
+        or os.environ.get("AWS_DEFAULT_PROFILE")
+        or os.environ.get("AWS_PROFILE")
+        or "default"
+    )
+    access_key_id = os.environ.get("AWS_ACCESS_KEY_ID")
+    if access_key_id:
+        key = "{}-{}".format(key, access_key_id)
+    return key
+
+
+class AccountContext:
+    """
+    Who buckup is signed in as and where it creates buckets. ``user_arn``
+    and ``account_alias`` are ``None`` when they can't be read.
+    """
+
+    def __init__(self, user_arn, account_alias, region=None, fetched_at=None):
+        self.user_arn = user_arn
+        self.account_alias = account_alias
+        self.region = region
+        self.fetched_at = fetched_at or time.time()
+
+    def as_json(self):
+        # The region is left out, as it depends on more than the credentials.
+        return {
+            "user_arn": self.user_arn,
+            "account_alias": self.account_alias,
+            "fetched_at": self.fetched_at,
+        }
+
+
+class AccountContextCache:
+    """
+    The ``AccountContext`` of a set of credentials stored on disk, used for
+    ``ttl`` seconds.
+    """
+
+    def __init__(self, profile_name=None, ttl=DEFAULT_TTL):
+        self.path = os.path.join(
+            get_cache_dir("account"),
+            "{}.json".format(get_credentials_key(profile_name)),
+        )
+        self.ttl = ttl
+
+    def get(self):
+        """
+        Return the cached context, or ``None`` if there is none or it is
+        stale.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+                context = AccountContext(
+                    data["user_arn"],
+                    data["account_alias"],
+                    fetched_at=data["fetched_at"],
+                )
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+        if time.time() - context.fetched_at >= self.ttl:
+            return None
+        return context
+
+    def set(self, context):
+        fd = os.open(self.path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(context.as_json(), f, indent=2)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def get_account_context(bucket_creator, cache=None, refresh=False):
+    """
+    Return the ``AccountContext`` from the cache, or look it up and cache
+    it. Missing credentials are raised and never cached.
+
+    The region is always resolved again, which botocore does from the
+    environment and the configuration files without calling AWS.
+    """
+    if cache is not None and not refresh:
+        context = cache.get()
+        if context is not None:
+            context.region = bucket_creator.backend.region_name
+            return context
+
+    def get_account_alias():
+        try:
+            return bucket_creator.get_current_account_alias()
+        except CannotListAccountAliases:
+            return None
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        account_alias = executor.submit(get_account_alias)
+        try:
+            user_arn = bucket_creator.get_current_user().arn
+        except CannotGetCurrentUser:
+            user_arn = None
+        context = AccountContext(
+            user_arn, account_alias.result(), bucket_creator.backend.region_name
+        )
+    if cache is not None:
+        cache.set(context)
+    return context
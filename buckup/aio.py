@@ -0,0 +1,150 @@
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from .bucket_creator import (
+    BucketCreator,
+    get_policy_hash,
+    is_bucket_not_found,
+    is_invalid_principal,
+    is_user_not_found,
+)
+from .paths import check_policy_size
+from .steps import StepGraph
+
+
+class AsyncBucketCreator:
+    """
+    Coroutine versions of ``BucketCreator.commit``, the validators and the
+    account lookups, for use from asyncio applications.
+
+    Waits for AWS to propagate new buckets and users sleep on the event
+    loop instead of in a thread, so any number of commits can wait at once.
+    Backend calls, which block, run on a shared pool of ``max_workers``
+    threads, only for as long as each call takes.
+
+    Takes the same arguments as ``BucketCreator``.
+    """
+
+    def __init__(self, max_workers=16, **kwargs):
+        self.bucket_creator = BucketCreator(**kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def backend(self):
+        return self.bucket_creator.backend
+
+    @property
+    def tracer(self):
+        return self.bucket_creator.tracer
+
+    def echo(self, *lines):
+        self.bucket_creator.echo(*lines)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def run(self, func, *args):
+        """
+        Call the blocking ``func`` on the thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args))
+
+    async def retry(self, name, func, retry_if, on_retry=None):
+        with self.tracer.span(name, category="wait") as span:
+            span.attributes["retries"] = 0
+
+            def on_retry_traced(attempt):
+                span.attributes["retries"] = attempt.number
+                if on_retry is not None:
+                    on_retry(attempt)
+
+            return await self.bucket_creator.retry_policy.call_async(
+                name, func, retry_if=retry_if, on_retry=on_retry_traced
+            )
+
+    async def validate_bucket_name(self, bucket_name):
+        await self.run(self.bucket_creator.validate_bucket_name, bucket_name)
+
+    async def validate_user_name(self, user_name):
+        await self.run(self.bucket_creator.validate_user_name, user_name)
+
+    async def get_current_user(self):
+        return await self.run(self.bucket_creator.get_current_user)
+
+    async def get_current_account_alias(self):
+        return await self.run(self.bucket_creator.get_current_account_alias)
+
+    async def wait_bucket_exists(self, bucket):
+        await self.retry(
+            "wait_bucket_exists",
+            lambda: self.run(self.backend.head_bucket, bucket.name),
+            retry_if=is_bucket_not_found,
+        )
+        return bucket
+
+    async def wait_user_exists(self, user):
+        await self.retry(
+            "wait_user_exists",
+            lambda: self.run(self.backend.get_user, user.name),
+            retry_if=is_user_not_found,
+        )
+        return user
+
+    async def set_bucket_policy(
+        self,
+        bucket,
+        user,
+        allow_public_acls,
+        public_get_object_paths=None,
+        previous_policy_sha256=None,
+    ):
+        bucket_creator = self.bucket_creator
+        policy = json.dumps(
+            bucket_creator.get_bucket_policy(bucket, user, public_get_object_paths)
+        )
+        if get_policy_hash(policy) == previous_policy_sha256:
+            return policy
+        await self.run(
+            bucket_creator.set_public_access,
+            bucket,
+            allow_public_acls,
+            public_get_object_paths,
+        )
+        check_policy_size(policy)
+        await self.retry(
+            "set_bucket_policy",
+            lambda: self.run(self.backend.put_bucket_policy, bucket.name, policy),
+            retry_if=is_invalid_principal,
+            on_retry=bucket_creator.echo_policy_retry,
+        )
+        self.echo("Bucket policy set.")
+        return policy
+
+    async def commit(self, data, journal=None, on_step=None):
+        """
+        Create the bucket and its owner described by ``data`` and return
+        the details needed to use them, like ``BucketCreator.commit``.
+
+        Runs the same steps, on the thread pool except for the waits. If a
+        step fails, the steps already running are awaited before the error
+        is raised.
+        """
+        bucket_creator = self.bucket_creator
+        await self.run(bucket_creator.validate_commit, data)
+        if journal is not None:
+            journal.start(data)
+        graph = StepGraph(
+            tracer=self.tracer, on_step=on_step, bucket_name=data["bucket_name"]
+        )
+        bucket_creator.add_commit_steps(graph, data, journal, waiter=self)
+        results = await graph.run_async(self.executor)
+        return bucket_creator.get_commit_result(data, results, journal)
@@ -0,0 +1,494 @@
+import json
+import re
+import secrets
+import threading
+import time
+
+from botocore.exceptions import ClientError, ParamValidationError
+
+from .exceptions import InvalidBucketName
+
+# What botocore accepts as a bucket name before sending a request.
+VALID_BUCKET_NAME = re.compile(r"^[a-zA-Z0-9.\-_]{1,255}$")
+# IAM users can't have more than two access keys.
+MAX_ACCESS_KEYS = 2
+
+
+def check_bucket_name(bucket_name):
+    """
+    Raise ``InvalidBucketName`` if botocore would refuse ``bucket_name``, or
+    if it has adjacent periods, without calling AWS.
+    """
+    if not VALID_BUCKET_NAME.match(bucket_name) or ".." in bucket_name:
+        raise InvalidBucketName('Invalid bucket name "{}".'.format(bucket_name))
+
+
+class Bucket:
+    def __init__(self, name, location=None):
+        self.name = name
+        self.location = location
+
+
+class User:
+    def __init__(self, name, arn):
+        self.name = name
+        self.arn = arn
+
+
+class AccessKeyPair:
+    def __init__(self, access_key_id, secret_access_key):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+
+
+class Backend:
+    """
+    The S3 and IAM operations ``BucketCreator`` makes.
+
+    Errors are raised as botocore's ``ClientError`` with the codes AWS
+    uses, so they are handled the same way whatever the backend.
+    """
+
+    region_name = None
+
+    def create_bucket(self, bucket_name, region):
+        """
+        Create the bucket and return its location.
+        """
+        raise NotImplementedError
+
+    def head_bucket(self, bucket_name):
+        raise NotImplementedError
+
+    def delete_bucket(self, bucket_name):
+        raise NotImplementedError
+
+    def list_buckets(self):
+        """
+        Return the names of the account's buckets.
+        """
+        raise NotImplementedError
+
+    def put_public_access_block(self, bucket_name, configuration):
+        raise NotImplementedError
+
+    def put_bucket_policy(self, bucket_name, policy):
+        raise NotImplementedError
+
+    def put_bucket_cors(self, bucket_name, configuration):
+        raise NotImplementedError
+
+    def enable_versioning(self, bucket_name):
+        raise NotImplementedError
+
+    def put_bucket_lifecycle_configuration(self, bucket_name, configuration):
+        raise NotImplementedError
+
+    def create_user(self, user_name, path=None):
+        raise NotImplementedError
+
+    def get_user(self, user_name):
+        raise NotImplementedError
+
+    def list_users(self, path_prefix="/"):
+        raise NotImplementedError
+
+    def update_user(self, user_name, new_user_name, new_path=None):
+        raise NotImplementedError
+
+    def delete_user(self, user_name):
+        raise NotImplementedError
+
+    def create_access_key(self, user_name):
+        raise NotImplementedError
+
+    def delete_access_key(self, user_name, access_key_id):
+        raise NotImplementedError
+
+    def get_current_user(self):
+        raise NotImplementedError
+
+    def list_account_aliases(self):
+        raise NotImplementedError
+
+
+class Boto3Backend(Backend):
+    """
+    Backend calling AWS with clients from a ``ClientPool``.
+    """
+
+    def __init__(self, pool, profile_name=None, region_name=None):
+        self.pool = pool
+        self.profile_name = profile_name
+        self._region_name = region_name
+
+    @property
+    def region_name(self):
+        return self.pool.get_session(self.profile_name, self._region_name).region_name
+
+    @property
+    def s3_client(self):
+        return self.pool.get_client("s3", self.profile_name, self._region_name)
+
+    @property
+    def iam_client(self):
+        return self.pool.get_client("iam", self.profile_name, self._region_name)
+
+    def create_bucket(self, bucket_name, region):
+        kwargs = {}
+        # us-east-1 does not work with location specified.
+        if region != "us-east-1":
+            kwargs["CreateBucketConfiguration"] = {"LocationConstraint": region}
+        response = self.s3_client.create_bucket(Bucket=bucket_name, **kwargs)
+        return response["Location"]
+
+    def head_bucket(self, bucket_name):
+        self.s3_client.head_bucket(Bucket=bucket_name)
+
+    def delete_bucket(self, bucket_name):
+        self.s3_client.delete_bucket(Bucket=bucket_name)
+
+    def list_buckets(self):
+        return [bucket["Name"] for bucket in self.s3_client.list_buckets()["Buckets"]]
+
+    def put_public_access_block(self, bucket_name, configuration):
+        self.s3_client.put_public_access_block(
+            Bucket=bucket_name, PublicAccessBlockConfiguration=configuration
+        )
+
+    def put_bucket_policy(self, bucket_name, policy):
+        self.s3_client.put_bucket_policy(Bucket=bucket_name, Policy=policy)
+
+    def put_bucket_cors(self, bucket_name, configuration):
+        self.s3_client.put_bucket_cors(
+            Bucket=bucket_name, CORSConfiguration=configuration
+        )
+
+    def enable_versioning(self, bucket_name):
+        self.s3_client.put_bucket_versioning(
+            Bucket=bucket_name, VersioningConfiguration={"Status": "Enabled"}
+        )
+
+    def put_bucket_lifecycle_configuration(self, bucket_name, configuration):
+        self.s3_client.put_bucket_lifecycle_configuration(
+            Bucket=bucket_name, LifecycleConfiguration=configuration
+        )
+
+    def create_user(self, user_name, path=None):
+        kwargs = {"Path": path} if path else {}
+        response = self.iam_client.create_user(UserName=user_name, **kwargs)
+        return User(response["User"]["UserName"], response["User"]["Arn"])
+
+    def get_user(self, user_name):
+        response = self.iam_client.get_user(UserName=user_name)
+        return User(response["User"]["UserName"], response["User"]["Arn"])
+
+    def list_users(self, path_prefix="/"):
+        paginator = self.iam_client.get_paginator("list_users")
+        return [
+            User(user["UserName"], user["Arn"])
+            for page in paginator.paginate(PathPrefix=path_prefix)
+            for user in page["Users"]
+        ]
+
+    def update_user(self, user_name, new_user_name, new_path=None):
+        kwargs = {"NewPath": new_path} if new_path else {}
+        self.iam_client.update_user(
+            UserName=user_name, NewUserName=new_user_name, **kwargs
+        )
+
+    def delete_user(self, user_name):
+        self.iam_client.delete_user(UserName=user_name)
+
+    def create_access_key(self, user_name):
+        response = self.iam_client.create_access_key(UserName=user_name)
+        return AccessKeyPair(
+            response["AccessKey"]["AccessKeyId"],
+            response["AccessKey"]["SecretAccessKey"],
+        )
+
+    def delete_access_key(self, user_name, access_key_id):
+        self.iam_client.delete_access_key(UserName=user_name, AccessKeyId=access_key_id)
+
+    def get_current_user(self):
+        response = self.iam_client.get_user()
+        return User(response["User"]["UserName"], response["User"]["Arn"])
+
+    def list_account_aliases(self):
+        return self.iam_client.list_account_aliases()["AccountAliases"]
+
+
+def client_error(operation_name, status_code, code, message):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": status_code},
+        },
+        operation_name,
+    )
+
+
+class MemoryBackend(Backend):
+    """
+    Backend keeping buckets and users in memory, for tests and simulations.
+
+    Every call can be delayed by ``latency`` seconds, and AWS eventual
+    consistency is simulated: a new bucket is not found by ``head_bucket``
+    for ``bucket_propagation`` seconds, and a new user is neither found by
+    ``get_user`` nor accepted as a policy principal for ``user_propagation``
+    seconds. A renamed user propagates again under its new name, for
+    ``rename_propagation`` seconds, which defaults to ``user_propagation``.
+    Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        region_name="us-east-1",
+        account_id="123456789012",
+        latency=0,
+        bucket_propagation=0,
+        user_propagation=0,
+        rename_propagation=None,
+    ):
+        self.region_name = region_name
+        self.account_id = account_id
+        self.latency = latency
+        self.bucket_propagation = bucket_propagation
+        self.user_propagation = user_propagation
+        self.rename_propagation = (
+            user_propagation if rename_propagation is None else rename_propagation
+        )
+        self.buckets = {}
+        self.users = {}
+        self.lock = threading.Lock()
+
+    def call(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def is_visible(self, created_at, propagation):
+        return time.monotonic() - created_at >= propagation
+
+    def get_user_arn(self, user_name, path="/"):
+        return "arn:aws:iam::{account_id}:user{path}{user_name}".format(
+            account_id=self.account_id, path=path, user_name=user_name
+        )
+
+    def user_not_found(self, operation_name, user_name):
+        return client_error(
+            operation_name,
+            404,
+            "NoSuchEntity",
+            "The user with name {} cannot be found.".format(user_name),
+        )
+
+    def get_bucket(self, operation_name, bucket_name):
+        try:
+            return self.buckets[bucket_name]
+        except KeyError:
+            raise client_error(
+                operation_name,
+                404,
+                "NoSuchBucket",
+                "The specified bucket does not exist",
+            ) from None
+
+    def create_bucket(self, bucket_name, region):
+        self.call()
+        with self.lock:
+            if bucket_name in self.buckets:
+                raise client_error(
+                    "CreateBucket",
+                    409,
+                    "BucketAlreadyOwnedByYou",
+                    "Your previous request to create the named bucket "
+                    "succeeded and you already own it.",
+                )
+            self.buckets[bucket_name] = {
+                "region": region,
+                "created_at": time.monotonic(),
+                "public_access_block": None,
+                "policy": None,
+                "cors": None,
+                "versioning": None,
+                "lifecycle": None,
+            }
+        return "/{}".format(bucket_name)
+
+    def head_bucket(self, bucket_name):
+        if not VALID_BUCKET_NAME.match(bucket_name):
+            raise ParamValidationError(
+                report='Invalid bucket name "{}"'.format(bucket_name)
+            )
+        self.call()
+        with self.lock:
+            bucket = self.buckets.get(bucket_name)
+        if bucket is None or not self.is_visible(
+            bucket["created_at"], self.bucket_propagation
+        ):
+            raise client_error("HeadBucket", 404, "404", "Not Found")
+
+    def delete_bucket(self, bucket_name):
+        self.call()
+        with self.lock:
+            self.get_bucket("DeleteBucket", bucket_name)
+            del self.buckets[bucket_name]
+
+    def list_buckets(self):
+        self.call()
+        with self.lock:
+            return list(self.buckets)
+
+    def put_public_access_block(self, bucket_name, configuration):
+        self.call()
+        with self.lock:
+            bucket = self.get_bucket("PutPublicAccessBlock", bucket_name)
+            bucket["public_access_block"] = dict(configuration)
+
+    def put_bucket_policy(self, bucket_name, policy):
+        self.call()
+        for statement in json.loads(policy)["Statement"]:
+            principal = statement["Principal"]
+            if not isinstance(principal, dict):
+                continue
+            user_name = principal["AWS"].rsplit("/", 1)[-1]
+            with self.lock:
+                user = self.users.get(user_name)
+            if user is None or not self.is_visible(
+                user["created_at"], self.user_propagation
+            ):
+                raise client_error(
+                    "PutBucketPolicy",
+                    400,
+                    "MalformedPolicy",
+                    "Invalid principal in policy",
+                )
+        with self.lock:
+            self.get_bucket("PutBucketPolicy", bucket_name)["policy"] = policy
+
+    def put_bucket_cors(self, bucket_name, configuration):
+        self.call()
+        with self.lock:
+            self.get_bucket("PutBucketCors", bucket_name)["cors"] = configuration
+
+    def enable_versioning(self, bucket_name):
+        self.call()
+        with self.lock:
+            self.get_bucket("PutBucketVersioning", bucket_name)["versioning"] = (
+                "Enabled"
+            )
+
+    def put_bucket_lifecycle_configuration(self, bucket_name, configuration):
+        self.call()
+        with self.lock:
+            self.get_bucket("PutBucketLifecycleConfiguration", bucket_name)[
+                "lifecycle"
+            ] = configuration
+
+    def create_user(self, user_name, path=None):
+        self.call()
+        with self.lock:
+            if user_name in self.users:
+                raise client_error(
+                    "CreateUser",
+                    409,
+                    "EntityAlreadyExists",
+                    "User with name {} already exists.".format(user_name),
+                )
+            self.users[user_name] = {
+                "path": path or "/",
+                "created_at": time.monotonic(),
+                "access_keys": [],
+            }
+        return User(user_name, self.get_user_arn(user_name, path or "/"))
+
+    def get_user(self, user_name):
+        self.call()
+        with self.lock:
+            user = self.users.get(user_name)
+        if user is None or not self.is_visible(
+            user["created_at"], self.user_propagation
+        ):
+            raise self.user_not_found("GetUser", user_name)
+        return User(user_name, self.get_user_arn(user_name, user["path"]))
+
+    def list_users(self, path_prefix="/"):
+        self.call()
+        with self.lock:
+            return [
+                User(user_name, self.get_user_arn(user_name, user["path"]))
+                for user_name, user in self.users.items()
+                if user["path"].startswith(path_prefix)
+            ]
+
+    def update_user(self, user_name, new_user_name, new_path=None):
+        """
+        Rename the user. Whether AWS makes the new name usable any sooner
+        than a new user's is not known, so by default it is not.
+        """
+        self.call()
+        with self.lock:
+            if user_name not in self.users:
+                raise self.user_not_found("UpdateUser", user_name)
+            if new_user_name in self.users:
+                raise client_error(
+                    "UpdateUser",
+                    409,
+                    "EntityAlreadyExists",
+                    "User with name {} already exists.".format(new_user_name),
+                )
+            user = self.users.pop(user_name)
+            if new_path:
+                user["path"] = new_path
+            # Shifted so the user is visible ``rename_propagation`` seconds
+            # from now.
+            user["created_at"] = (
+                time.monotonic() - self.user_propagation + self.rename_propagation
+            )
+            self.users[new_user_name] = user
+
+    def delete_user(self, user_name):
+        self.call()
+        with self.lock:
+            if self.users.pop(user_name, None) is None:
+                raise self.user_not_found("DeleteUser", user_name)
+
+    def create_access_key(self, user_name):
+        self.call()
+        access_key_pair = AccessKeyPair(
+            "AKIA" + secrets.token_hex(8).upper(), secrets.token_urlsafe(30)
+        )
+        with self.lock:
+            user = self.users.get(user_name)
+            if user is None:
+                raise self.user_not_found("CreateAccessKey", user_name)
+            if len(user["access_keys"]) >= MAX_ACCESS_KEYS:
+                raise client_error(
+                    "CreateAccessKey",
+                    409,
+                    "LimitExceeded",
+                    "Cannot exceed quota for AccessKeysPerUser: 2",
+                )
+            user["access_keys"].append(access_key_pair.access_key_id)
+        return access_key_pair
+
+    def delete_access_key(self, user_name, access_key_id):
+        self.call()
+        with self.lock:
+            user = self.users.get(user_name)
+            if user is None or access_key_id not in user["access_keys"]:
+                raise client_error(
+                    "DeleteAccessKey",
+                    404,
+                    "NoSuchEntity",
+                    "The Access Key with id {} cannot be found.".format(access_key_id),
+                )
+            user["access_keys"].remove(access_key_id)
+
+    def get_current_user(self):
+        self.call()
+        return User("buckup", self.get_user_arn("buckup"))
+
+    def list_account_aliases(self):
+        self.call()
+        return []
@@ -0,0 +1,229 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from .bucket_creator import USER_NAME_FORMAT, BucketCreator
+from .exceptions import InvalidManifest
+from .journal import Journal
+from .pool import DEFAULT_MAX_POOL_CONNECTIONS, ClientPool
+
+SPEC_KEYS = frozenset(
+    [
+        "bucket_name",
+        "region",
+        "user_name",
+        "allow_public_acls",
+        "public_get_object_paths",
+        "cors_origins",
+        "enable_versioning",
+        "seed_directory",
+        "seed_concurrency",
+        "seed_part_size",
+        "copy_from",
+        "copy_concurrency",
+        "noncurrent_version_expiration_days",
+        "abort_multipart_upload_days",
+        "intelligent_tiering",
+    ]
+)
+STRING_KEYS = ("region", "user_name", "seed_directory", "copy_from")
+BOOLEAN_KEYS = ("allow_public_acls", "enable_versioning", "intelligent_tiering")
+LIST_KEYS = ("public_get_object_paths", "cors_origins")
+POSITIVE_INT_KEYS = (
+    "seed_concurrency",
+    "seed_part_size",
+    "copy_concurrency",
+    "noncurrent_version_expiration_days",
+    "abort_multipart_upload_days",
+)
+
+
+def load_manifest(path, fill_defaults=True):
+    """
+    Load bucket specs from a JSON or YAML manifest.
+
+    The manifest is either a list of bucket specs or a mapping with a
+    "buckets" list and optional "defaults" applied to every bucket. The
+    specs are checked either way, but only get buckup's defaults for the
+    keys they leave out if ``fill_defaults`` is true.
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise InvalidManifest(
+                    "PyYAML is required to read YAML manifests. "
+                    'Install it with "pip install pyyaml".'
+                ) from None
+            try:
+                manifest = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise InvalidManifest(str(e)) from e
+        else:
+            try:
+                manifest = json.load(f)
+            except ValueError as e:
+                raise InvalidManifest(str(e)) from e
+
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = manifest.get("defaults") or {}
+        manifest = manifest.get("buckets")
+    if not isinstance(manifest, list) or not manifest:
+        raise InvalidManifest("The manifest does not list any buckets.")
+    specs = []
+    for spec in manifest:
+        if isinstance(spec, str):
+            spec = {"bucket_name": spec}
+        if not isinstance(spec, dict):
+            raise InvalidManifest("Every bucket spec must be a mapping or a name.")
+        spec = dict(defaults, **spec)
+        built_spec = build_spec(spec)
+        specs.append(built_spec if fill_defaults else spec)
+    bucket_names = [spec["bucket_name"] for spec in specs]
+    if len(set(bucket_names)) != len(bucket_names):
+        raise InvalidManifest("The manifest lists a bucket more than once.")
+    return specs
+
+
+def is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+
+def validate_spec(spec):
+    """
+    Raise ``InvalidManifest`` if a value of ``spec`` has the wrong type.
+    ``None`` stands for the default of any key.
+    """
+    if not spec.get("bucket_name") or not isinstance(spec["bucket_name"], str):
+        raise InvalidManifest('Every bucket spec needs a "bucket_name".')
+    for key in STRING_KEYS:
+        if spec.get(key) is not None and not isinstance(spec[key], str):
+            raise InvalidManifest('"{}" must be a string.'.format(key))
+    for key in BOOLEAN_KEYS:
+        if spec.get(key) is not None and not isinstance(spec[key], bool):
+            raise InvalidManifest('"{}" must be true or false.'.format(key))
+    for key in POSITIVE_INT_KEYS:
+        if spec.get(key) is not None and not is_positive_int(spec[key]):
+            raise InvalidManifest('"{}" must be a positive integer.'.format(key))
+    for key in LIST_KEYS:
+        # A string is iterable too, and would be split into characters.
+        values = spec.get(key)
+        if values is not None and (
+            not isinstance(values, (list, tuple, set, frozenset))
+            or not all(isinstance(value, str) for value in values)
+        ):
+            raise InvalidManifest('"{}" must be a list of strings.'.format(key))
+    public_paths = set(spec.get("public_get_object_paths") or ())
+    if "*" in public_paths and len(public_paths) > 1:
+        raise InvalidManifest(
+            '"public_get_object_paths" cannot list "*" with other paths.'
+        )
+
+
+def build_spec(spec, region=None):
+    """
+    Fill in the defaults of a bucket spec so it can be passed to
+    ``BucketCreator.commit()``.
+    """
+    unknown_keys = set(spec) - SPEC_KEYS
+    if unknown_keys:
+        raise InvalidManifest(
+            "Unknown keys in bucket spec: {}.".format(", ".join(sorted(unknown_keys)))
+        )
+    validate_spec(spec)
+    spec = dict(spec)
+    spec.setdefault("region", region)
+    spec.setdefault(
+        "user_name", USER_NAME_FORMAT.format(bucket_name=spec["bucket_name"])
+    )
+    spec.setdefault("allow_public_acls", False)
+    spec.setdefault("enable_versioning", False)
+    spec["public_get_object_paths"] = frozenset(
+        spec.get("public_get_object_paths") or []
+    )
+    spec["cors_origins"] = list(spec.get("cors_origins") or [])
+    return spec
+
+
+class BatchResult:
+    def __init__(self, spec, result=None, error=None, duration=0):
+        self.spec = spec
+        self.result = result
+        self.error = error
+        self.duration = duration
+
+    @property
+    def bucket_name(self):
+        return self.spec["bucket_name"]
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchProvisioner:
+    """
+    Provision many buckets at once using a bounded pool of workers.
+    """
+
+    def __init__(
+        self,
+        profile_name=None,
+        region_name=None,
+        max_workers=4,
+        retry_policy=None,
+        tracer=None,
+        resume=False,
+        user_pool=None,
+    ):
+        if max_workers < 1:
+            raise ValueError("'max_workers' must be at least 1.")
+        self.profile_name = profile_name
+        self.region_name = region_name
+        self.max_workers = max_workers
+        self.retry_policy = retry_policy
+        self.tracer = tracer
+        self.resume = resume
+        self.user_pool = user_pool
+        # Every bucket runs a few steps at once, all sharing the clients.
+        self.pool = ClientPool(
+            max_pool_connections=max(DEFAULT_MAX_POOL_CONNECTIONS, max_workers * 5),
+            tracer=tracer,
+        )
+
+    def provision(self, spec):
+        start = time.monotonic()
+        try:
+            bucket_creator = BucketCreator(
+                profile_name=self.profile_name,
+                region_name=spec["region"] or self.region_name,
+                quiet=True,
+                retry_policy=self.retry_policy,
+                tracer=self.tracer,
+                pool=self.pool,
+                user_pool=self.user_pool,
+            )
+            if not spec["region"]:
+                spec = dict(spec, region=bucket_creator.backend.region_name)
+            journal = Journal(spec["bucket_name"])
+            # A resumed bucket and its user exist already.
+            if not (self.resume and journal.exists()):
+                bucket_creator.validate_bucket_name(spec["bucket_name"])
+                bucket_creator.validate_user_name(spec["user_name"])
+                journal.clear()
+            result = bucket_creator.commit(spec, journal=journal)
+        except Exception as e:
+            return BatchResult(spec, error=e, duration=time.monotonic() - start)
+        return BatchResult(spec, result=result, duration=time.monotonic() - start)
+
+    def run(self, specs):
+        """
+        Provision every spec, yielding a ``BatchResult`` for each bucket as
+        soon as it is done.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self.provision, spec) for spec in specs]
+            for future in as_completed(futures):
+                yield future.result()
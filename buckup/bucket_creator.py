@@ -1,10 +1,16 @@
+import functools
+import hashlib
+import inspect
 import json
-import time
+import os
+import threading
+from types import SimpleNamespace
 
-import boto3
 from botocore.exceptions import ClientError, NoCredentialsError, ParamValidationError
 
+from .backends import Boto3Backend, Bucket, User
 from .exceptions import (
+    BucketDoesNotExist,
     BucketNameAlreadyInUse,
     CannotGetCurrentUser,
     CannotListAccountAliases,
@@ -13,53 +19,356 @@ from .exceptions import (
     InvalidUserName,
     UserNameTaken,
 )
+from .paths import check_policy_size, compact_paths
+from .pool import ClientPool
+from .retry import RetryPolicy
+from .steps import StepGraph
+from .tracing import NullTracer, get_error_code
+from .transfer import (
+    DEFAULT_PART_SIZE,
+    MB,
+    BucketCopier,
+    DirectoryUploader,
+    parse_bucket_path,
+)
 
 POLICY_NAME_FORMAT = "{bucket_name}-owner-policy"
+USER_NAME_FORMAT = "{bucket_name}-s3-owner"
+# Lifecycle rules created by buckup, told apart from the bucket's other
+# rules by their ID.
+LIFECYCLE_RULE_PREFIX = "buckup-"
+
+
+def get_policy_hash(policy):
+    return hashlib.sha256(policy.encode()).hexdigest()
+
+
+def is_bucket_not_found(error):
+    return isinstance(error, ClientError) and error.response["Error"]["Code"] in (
+        "404",
+        "NoSuchBucket",
+    )
+
+
+def is_user_not_found(error):
+    return (
+        isinstance(error, ClientError)
+        and error.response["Error"]["Code"] == "NoSuchEntity"
+    )
+
+
+def is_invalid_principal(error):
+    return (
+        isinstance(error, ClientError)
+        and error.response["Error"]["Message"] == "Invalid principal in policy"
+    )
 
 
 class BucketCreator:
-    def __init__(self, profile_name=None, region_name=None):
-        self.session = boto3.session.Session(
-            profile_name=profile_name, region_name=region_name
+    def __init__(
+        self,
+        profile_name=None,
+        region_name=None,
+        quiet=False,
+        retry_policy=None,
+        tracer=None,
+        pool=None,
+        backend=None,
+        user_pool=None,
+    ):
+        self.profile_name = profile_name
+        self.region_name = region_name
+        self.quiet = quiet
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.tracer = tracer or NullTracer()
+        self.pool = pool or ClientPool(tracer=self.tracer)
+        self.backend = backend or Boto3Backend(self.pool, profile_name, region_name)
+        # A ``WarmUserPool`` to claim users from instead of creating them.
+        self.user_pool = user_pool
+        self._echo_lock = threading.Lock()
+
+    @property
+    def session(self):
+        return self.pool.get_session(self.profile_name, self.region_name)
+
+    @property
+    def s3(self):
+        return self.pool.get_resource("s3", self.profile_name, self.region_name)
+
+    @property
+    def s3_client(self):
+        return self.pool.get_client("s3", self.profile_name, self.region_name)
+
+    @property
+    def iam(self):
+        return self.pool.get_resource("iam", self.profile_name, self.region_name)
+
+    def retry(self, name, func, retry_if, on_retry=None):
+        """
+        Call ``func`` with the retry policy, recording the wait as a span.
+        """
+        with self.tracer.span(name, category="wait") as span:
+            span.attributes["retries"] = 0
+
+            def on_retry_traced(attempt):
+                span.attributes["retries"] = attempt.number
+                if on_retry is not None:
+                    on_retry(attempt)
+
+            return self.retry_policy.call(
+                name, func, retry_if=retry_if, on_retry=on_retry_traced
+            )
+
+    def echo(self, *lines):
+        """
+        Print the given lines together, unless the creator is quiet.
+        """
+        if self.quiet:
+            return
+        with self._echo_lock:
+            for line in lines:
+                print(line)
+
+    def add_step(
+        self, graph, journal, name, func, requires=(), save=None, restore=None
+    ):
+        """
+        Add a step that records its outputs in the journal, or that is
+        replaced by ``restore`` if the journal shows it already completed.
+        ``func`` can be a coroutine function.
+        """
+        if journal is not None and journal.is_done(name) and restore is not None:
+            outputs = journal.get(name)
+            graph.add(name, lambda *args: restore(outputs), requires=requires)
+            return
+
+        def record(result):
+            if journal is not None:
+                journal.record(name, save(result) if save else None)
+            return result
+
+        if inspect.iscoroutinefunction(func):
+
+            async def step(*args):
+                return record(await func(*args))
+
+        else:
+
+            def step(*args):
+                return record(func(*args))
+
+        graph.add(name, step, requires=requires)
+
+    def validate_commit(self, data):
+        """
+        Check what ``commit`` is given before anything is created.
+        """
+        self.validate_bucket_policy_size(
+            data["bucket_name"], data["user_name"], data.get("public_get_object_paths")
+        )
+        if data.get("seed_directory") and not os.path.isdir(data["seed_directory"]):
+            raise ValueError('"{}" is not a directory.'.format(data["seed_directory"]))
+        if data.get("copy_from"):
+            self.validate_copy_source(data["copy_from"])
+
+    def add_commit_steps(self, graph, data, journal=None, waiter=None):
+        """
+        Add the steps of ``commit`` to ``graph``.
+
+        The steps waiting for AWS to propagate changes, ``wait_bucket_exists``,
+        ``wait_user_exists`` and ``set_bucket_policy``, are methods of
+        ``waiter``, which defaults to the creator itself.
+        """
+        waiter = waiter or self
+        bucket_name = data["bucket_name"]
+        # Resources are recorded as soon as they are created, so a commit
+        # resumed while AWS propagates them waits again instead of creating
+        # them twice.
+        self.add_step(
+            graph,
+            journal,
+            "create_bucket",
+            lambda: self.create_bucket(bucket_name, data["region"], wait=False),
+            save=lambda bucket: {
+                "bucket_name": bucket.name,
+                "location": bucket.location,
+            },
+            restore=lambda outputs: Bucket(
+                outputs["bucket_name"], outputs.get("location")
+            ),
+        )
+        graph.add(
+            "wait_bucket_exists", waiter.wait_bucket_exists, requires=["create_bucket"]
+        )
+        # The user does not depend on the bucket existing, so both waits can
+        # overlap.
+        self.add_step(
+            graph,
+            journal,
+            "create_user",
+            lambda: self.create_user(
+                Bucket(bucket_name), data["user_name"], wait=False
+            ),
+            save=lambda user: {"user_name": user.name, "user_arn": user.arn},
+            restore=lambda outputs: User(outputs["user_name"], outputs["user_arn"]),
+        )
+        graph.add("wait_user_exists", waiter.wait_user_exists, requires=["create_user"])
+        previous_access_key = journal and journal.get("create_access_key_pair")
+
+        def create_access_key_pair(user):
+            # The secret of a key created by an earlier attempt can't be
+            # read again, so that key is replaced.
+            if previous_access_key:
+                self.delete_access_key(user, previous_access_key["access_key_id"])
+            return self.create_user_access_key_pair(user)
+
+        self.add_step(
+            graph,
+            journal,
+            "create_access_key_pair",
+            create_access_key_pair,
+            requires=["wait_user_exists"],
+            save=lambda access_key_pair: {
+                "access_key_id": access_key_pair.access_key_id
+            },
         )
-        self.s3 = self.session.resource("s3")
-        self.s3_client = self.session.client("s3")
-        self.iam = self.session.resource("iam")
-
-    def commit(self, data):
-        bucket = self.create_bucket(data["bucket_name"], data["region"])
-        user = self.create_user(bucket, data["user_name"])
-        self.set_bucket_policy(
-            bucket,
-            user,
-            allow_public_acls=data["allow_public_acls"],
-            public_get_object_paths=data.get("public_get_object_paths"),
+        previous_policy = journal and journal.get("set_bucket_policy")
+        self.add_step(
+            graph,
+            journal,
+            "set_bucket_policy",
+            functools.partial(
+                waiter.set_bucket_policy,
+                allow_public_acls=data["allow_public_acls"],
+                public_get_object_paths=data.get("public_get_object_paths"),
+                previous_policy_sha256=(
+                    previous_policy["policy_sha256"] if previous_policy else None
+                ),
+            ),
+            requires=["wait_bucket_exists", "wait_user_exists"],
+            save=lambda policy: {"policy_sha256": get_policy_hash(policy)},
         )
         if data.get("cors_origins"):
-            self.set_cors(bucket, data["cors_origins"])
+            self.add_step(
+                graph,
+                journal,
+                "set_cors",
+                lambda bucket: self.set_cors(bucket, data["cors_origins"]),
+                requires=["wait_bucket_exists"],
+                restore=lambda outputs: None,
+            )
         if data.get("enable_versioning"):
-            self.enable_versioning(bucket)
+            self.add_step(
+                graph,
+                journal,
+                "enable_versioning",
+                self.enable_versioning,
+                requires=["wait_bucket_exists"],
+                restore=lambda outputs: None,
+            )
+        lifecycle_rules = self.get_lifecycle_rules(
+            data.get("noncurrent_version_expiration_days"),
+            data.get("abort_multipart_upload_days"),
+            data.get("intelligent_tiering"),
+        )
+        if lifecycle_rules:
+            self.add_step(
+                graph,
+                journal,
+                "set_lifecycle",
+                lambda bucket: self.set_lifecycle(bucket, lifecycle_rules),
+                requires=["wait_bucket_exists"],
+                restore=lambda outputs: None,
+            )
+        if data.get("seed_directory"):
+            self.add_step(
+                graph,
+                journal,
+                "seed_directory",
+                lambda bucket: self.seed_directory(
+                    bucket,
+                    data["seed_directory"],
+                    max_workers=data.get("seed_concurrency") or 10,
+                    part_size=(data.get("seed_part_size") or 8) * MB,
+                ),
+                requires=["wait_bucket_exists"],
+                restore=lambda outputs: None,
+            )
+        if data.get("copy_from"):
+            self.add_step(
+                graph,
+                journal,
+                "copy_from",
+                lambda bucket: self.copy_from(
+                    bucket,
+                    data["copy_from"],
+                    max_workers=data.get("copy_concurrency") or 10,
+                ),
+                requires=["wait_bucket_exists"],
+                restore=lambda outputs: None,
+            )
+
+    def get_commit_result(self, data, results, journal=None):
+        """
+        Return the details of the bucket and its owner from the results of
+        the steps of ``commit``, and delete the journal they are done with.
+        """
+        bucket = results["create_bucket"]
+        user = results["create_user"]
+        access_key_pair = results["create_access_key_pair"]
+        result = {
+            "bucket_name": bucket.name,
+            "region": data["region"],
+            "user_name": user.name,
+            "user_arn": user.arn,
+            "access_key_id": access_key_pair.access_key_id,
+            "secret_access_key": access_key_pair.secret_access_key,
+        }
+        if results.get("seed_directory"):
+            result["seed_report"] = results["seed_directory"]
+        if results.get("copy_from"):
+            result["copy_report"] = results["copy_from"]
+        if journal is not None:
+            journal.delete()
+        return result
+
+    def commit(self, data, journal=None, on_step=None):
+        """
+        Create the bucket and its owner described by ``data`` and return
+        the details needed to use them.
+
+        With a ``journal``, every completed step is recorded in it and steps
+        it already records are skipped, so a failed commit can be run again.
+
+        ``on_step`` is called with the name and the result of every step as
+        soon as it completes.
+        """
+        self.validate_commit(data)
+        if journal is not None:
+            journal.start(data)
+        graph = StepGraph(
+            tracer=self.tracer, on_step=on_step, bucket_name=data["bucket_name"]
+        )
+        self.add_commit_steps(graph, data, journal)
+        return self.get_commit_result(data, graph.run(), journal)
 
     def get_bucket_policy_statement_for_get_object(
         self, bucket, public_get_object_paths
     ):
         """
         Create policy statement to enable the public to perform s3:getObject
-        on specified paths.
+        on specified paths. Paths covered by another path are left out.
         """
-        if public_get_object_paths:
-
-            def format_path(path):
-                if path.startswith("/"):
-                    path = path[1:]
-                return "arn:aws:s3:::{bucket_name}/{path}".format(
-                    bucket_name=bucket.name,
-                    path=path,
-                )
-
+        paths = compact_paths(public_get_object_paths or [])
+        if paths:
             paths_resources = []
-            for path in public_get_object_paths:
-                paths_resources.append(format_path(path))
+            for path in paths:
+                paths_resources.append(
+                    "arn:aws:s3:::{bucket_name}/{path}".format(
+                        bucket_name=bucket.name,
+                        path=path,
+                    )
+                )
             return {
                 "Sid": "PublicGetObject",
                 "Effect": "Allow",
@@ -106,135 +415,317 @@ class BucketCreator:
             "Resource": "arn:aws:s3:::{bucket_name}/*".format(bucket_name=bucket.name),
         }
 
-    def set_bucket_policy(
-        self, bucket, user, allow_public_acls, public_get_object_paths=None
+    def get_public_access_block_configuration(
+        self, allow_public_acls, public_get_object_paths=None
     ):
         public_access = bool(public_get_object_paths)
+        return {
+            "BlockPublicAcls": not allow_public_acls,
+            "IgnorePublicAcls": not allow_public_acls,
+            "BlockPublicPolicy": not public_access,
+            "RestrictPublicBuckets": not public_access,
+        }
 
-        # NB: This API doesn't exist on a `Bucket`
-        self.s3_client.put_public_access_block(
-            Bucket=bucket.name,
-            PublicAccessBlockConfiguration={
-                "BlockPublicAcls": not allow_public_acls,
-                "IgnorePublicAcls": not allow_public_acls,
-                "BlockPublicPolicy": not public_access,
-                "RestrictPublicBuckets": not public_access,
-            },
-        )
-        if public_access or allow_public_acls:
-            print("Configured public access to bucket.")
-
+    def get_bucket_policy(self, bucket, user, public_get_object_paths=None):
         policy_statement = list(
             self.get_bucket_policy_statements_for_user_access(bucket, user)
         )
 
-        if public_access:
-            policy_statement.append(
-                self.get_bucket_policy_statement_for_get_object(
-                    bucket, public_get_object_paths
-                )
+        get_object_statement = self.get_bucket_policy_statement_for_get_object(
+            bucket, public_get_object_paths
+        )
+        if get_object_statement:
+            policy_statement.append(get_object_statement)
+        return {
+            "Version": "2012-10-17",
+            "Statement": policy_statement,
+        }
+
+    def validate_bucket_policy_size(
+        self, bucket_name, user_name, public_get_object_paths=None
+    ):
+        """
+        Check the policy will fit before anything is created. The user's ARN
+        is not known yet, but its length is.
+        """
+        bucket = SimpleNamespace(name=bucket_name)
+        user = SimpleNamespace(
+            arn="arn:aws:iam::000000000000:user/{}".format(user_name)
+        )
+        check_policy_size(
+            json.dumps(self.get_bucket_policy(bucket, user, public_get_object_paths))
+        )
+
+    def set_public_access(
+        self, bucket, allow_public_acls, public_get_object_paths=None
+    ):
+        self.backend.put_public_access_block(
+            bucket.name,
+            self.get_public_access_block_configuration(
+                allow_public_acls, public_get_object_paths
+            ),
+        )
+        if public_get_object_paths or allow_public_acls:
+            self.echo("Configured public access to bucket.")
+
+    def echo_policy_retry(self, attempt):
+        if attempt.number == 1:
+            self.echo(
+                "Waiting for the user to be available to be attached to the policy."
             )
+
+    def set_bucket_policy(
+        self,
+        bucket,
+        user,
+        allow_public_acls,
+        public_get_object_paths=None,
+        previous_policy_sha256=None,
+    ):
+        """
+        Set the public access block and the policy of the bucket, unless
+        ``previous_policy_sha256`` shows the same policy was set already.
+        """
         policy = json.dumps(
-            {
-                "Version": "2012-10-17",
-                "Statement": policy_statement,
-            }
+            self.get_bucket_policy(bucket, user, public_get_object_paths)
         )
-        while True:
-            try:
-                bucket.Policy().put(Policy=policy)
-            except ClientError as e:
-                if e.response["Error"]["Message"] == "Invalid principal in policy":
-                    print(
-                        "Waiting for the user to be available to be "
-                        "attached to the policy (wait 5s)."
-                    )
-                    time.sleep(5)
-                    continue
-                raise e
-            else:
-                break
-        print("Bucket policy set.")
-
-    def create_bucket(self, name, region):
-        """
-        Create bucket of name in the given region.
-        """
-        create_bucket_kwargs = {}
-        create_bucket_config = {}
-        # us-east-1 does not work with location specified.
-        if region != "us-east-1":
-            create_bucket_config["LocationConstraint"] = region
-        if create_bucket_config:
-            create_bucket_kwargs["CreateBucketConfiguration"] = create_bucket_config
-        bucket = self.s3.Bucket(name)
-        response = bucket.create(**create_bucket_kwargs)
+        if get_policy_hash(policy) == previous_policy_sha256:
+            return policy
+        self.set_public_access(bucket, allow_public_acls, public_get_object_paths)
+        check_policy_size(policy)
+        # IAM users take a while to become visible to S3, until then the
+        # policy is rejected.
+        self.retry(
+            "set_bucket_policy",
+            lambda: self.backend.put_bucket_policy(bucket.name, policy),
+            retry_if=is_invalid_principal,
+            on_retry=self.echo_policy_retry,
+        )
+        self.echo("Bucket policy set.")
+        return policy
+
+    def create_bucket(self, name, region, wait=True):
+        """
+        Create bucket of name in the given region and, if ``wait`` is true,
+        wait until it exists.
+        """
+        location = self.backend.create_bucket(name, region)
         msg = (
             'Created bucket "{bucket_name}" at "{bucket_location}" in '
             'region "{region}".'
         )
-        print(
+        self.echo(
             msg.format(
                 bucket_name=name,
-                bucket_location=response["Location"],
+                bucket_location=location,
                 region=region,
-            )
+            ),
+            "",
+            f"AWS_STORAGE_BUCKET_NAME='{name}'",
+            "",
+        )
+        bucket = Bucket(name, location)
+        if wait:
+            self.wait_bucket_exists(bucket)
+        return bucket
+
+    def wait_bucket_exists(self, bucket):
+        self.retry(
+            "wait_bucket_exists",
+            lambda: self.backend.head_bucket(bucket.name),
+            retry_if=is_bucket_not_found,
         )
-        print()
-        print(f"AWS_STORAGE_BUCKET_NAME='{name}'")
-        print()
-        bucket.wait_until_exists()
         return bucket
 
+    def seed_directory(
+        self, bucket, directory, max_workers=10, part_size=DEFAULT_PART_SIZE
+    ):
+        """
+        Upload the contents of a local directory into the bucket.
+        """
+        uploader = DirectoryUploader(
+            self.s3_client, max_workers=max_workers, part_size=part_size
+        )
+        report = uploader.upload(bucket.name, directory)
+        self.echo(
+            'Uploaded "{directory}" to "{bucket_name}": {report}.'.format(
+                directory=directory, bucket_name=bucket.name, report=report
+            )
+        )
+        return report
+
+    def validate_copy_source(self, source):
+        """
+        Check the bucket in ``source`` ("bucket/prefix") can be read before
+        anything is created.
+        """
+        source_bucket, _ = parse_bucket_path(source)
+        try:
+            self.backend.head_bucket(source_bucket)
+        except ClientError as e:
+            if get_error_code(e) in ("404", "NoSuchBucket"):
+                raise BucketDoesNotExist(
+                    'Bucket "{}" does not exist.'.format(source_bucket)
+                ) from e
+            raise
+
+    def copy_from(self, bucket, source, max_workers=10):
+        """
+        Copy the objects under ``source`` ("bucket/prefix") into the bucket,
+        server-side.
+        """
+        copier = BucketCopier(self.s3_client, max_workers=max_workers)
+        report = copier.copy(source, bucket.name)
+        self.echo(
+            'Copied "{source}" to "{bucket_name}": {report}.'.format(
+                source=source, bucket_name=bucket.name, report=report
+            )
+        )
+        return report
+
     def enable_versioning(self, bucket):
-        bucket.Versioning().enable()
-        print('Enabled versioning for "{}".'.format(bucket.name))
-
-    def create_user(self, bucket, user_name):
-        user = self.iam.User(user_name).create()
-        self.iam.meta.client.get_waiter("user_exists").wait(UserName=user_name)
-        user.load()
-        print('Created IAM user "{user_name}".'.format(user_name=user.arn))
-        self.create_user_access_key_pair(user)
+        self.backend.enable_versioning(bucket.name)
+        self.echo('Enabled versioning for "{}".'.format(bucket.name))
+
+    def claim_spare_user(self, user_name):
+        """
+        Return a spare user of the warm pool renamed to ``user_name``, or
+        ``None`` if there isn't one.
+        """
+        if self.user_pool is None:
+            return None
+        user = self.user_pool.claim(user_name)
+        if user is not None:
+            self.echo(
+                'Claimed a spare IAM user as "{user_name}".'.format(user_name=user.arn)
+            )
+        return user
+
+    def get_lifecycle_rules(
+        self,
+        noncurrent_version_expiration_days=None,
+        abort_multipart_upload_days=None,
+        intelligent_tiering=False,
+    ):
+        """
+        Return the lifecycle rules keeping the bucket from growing: expire
+        object versions some days after they stop being current, abort
+        multipart uploads left incomplete and move objects to the
+        Intelligent-Tiering storage class.
+        """
+        rules = []
+        if noncurrent_version_expiration_days:
+            rules.append(
+                {
+                    "ID": LIFECYCLE_RULE_PREFIX + "expire-noncurrent-versions",
+                    "Filter": {"Prefix": ""},
+                    "Status": "Enabled",
+                    "NoncurrentVersionExpiration": {
+                        "NoncurrentDays": noncurrent_version_expiration_days
+                    },
+                }
+            )
+        if abort_multipart_upload_days:
+            rules.append(
+                {
+                    "ID": LIFECYCLE_RULE_PREFIX + "abort-incomplete-multipart-uploads",
+                    "Filter": {"Prefix": ""},
+                    "Status": "Enabled",
+                    "AbortIncompleteMultipartUpload": {
+                        "DaysAfterInitiation": abort_multipart_upload_days
+                    },
+                }
+            )
+        if intelligent_tiering:
+            rules.append(
+                {
+                    "ID": LIFECYCLE_RULE_PREFIX + "intelligent-tiering",
+                    "Filter": {"Prefix": ""},
+                    "Status": "Enabled",
+                    "Transitions": [{"Days": 0, "StorageClass": "INTELLIGENT_TIERING"}],
+                }
+            )
+        return rules
+
+    def set_lifecycle(self, bucket, rules):
+        self.backend.put_bucket_lifecycle_configuration(bucket.name, {"Rules": rules})
+        self.echo(
+            'Set lifecycle rules {rule_ids} on bucket "{bucket_name}".'.format(
+                rule_ids=", ".join(rule["ID"] for rule in rules),
+                bucket_name=bucket.name,
+            )
+        )
+
+    def create_user(self, bucket, user_name, wait=True):
+        user = self.claim_spare_user(user_name)
+        if user is None:
+            user = self.backend.create_user(user_name)
+            self.echo('Created IAM user "{user_name}".'.format(user_name=user.arn))
+        if wait:
+            self.wait_user_exists(user)
+        return user
+
+    def wait_user_exists(self, user):
+        self.retry(
+            "wait_user_exists",
+            lambda: self.backend.get_user(user.name),
+            retry_if=is_user_not_found,
+        )
         return user
 
     def create_user_access_key_pair(self, user):
-        access_key_pair = user.create_access_key_pair()
-        print(
+        access_key_pair = self.backend.create_access_key(user.name)
+        self.echo(
             'Created access key pair for user "{user}".'.format(
                 user=user.arn,
-            )
+            ),
+            "",
+            f"AWS_ACCESS_KEY_ID='{access_key_pair.access_key_id}'",
+            f"AWS_SECRET_ACCESS_KEY='{access_key_pair.secret_access_key}'",
+            "",
         )
-        print()
-        print(f"AWS_ACCESS_KEY_ID='{access_key_pair.access_key_id}'")
-        print(f"AWS_SECRET_ACCESS_KEY='{access_key_pair.secret_access_key}'")
-        print()
         return access_key_pair
 
-    def set_cors(self, bucket, origins):
+    def delete_access_key(self, user, access_key_id):
+        try:
+            self.backend.delete_access_key(user.name, access_key_id)
+        except ClientError as e:
+            if get_error_code(e) != "NoSuchEntity":
+                raise
+            return
+        self.echo(
+            'Deleted access key "{access_key_id}" of user "{user}".'.format(
+                access_key_id=access_key_id, user=user.name
+            )
+        )
+
+    def get_cors_configuration(self, origins):
         try:
             # Validates that the origins is an iterable and is
             # not empty.
             next(iter(origins))
         except StopIteration:
             raise ValueError("'origins' cannot be empty.") from None
-        config = {
+        return {
             "CORSRules": [
                 {
                     "AllowedMethods": ["GET"],
-                    "AllowedOrigins": origins,
+                    "AllowedOrigins": list(origins),
                     "MaxAgeSeconds": 3000,
                     "AllowedHeaders": ["Authorization"],
                 }
             ]
         }
+
+    def set_cors(self, bucket, origins):
+        config = self.get_cors_configuration(origins)
         msg = 'Set CORS for domains {domains} to bucket "{bucket_name}".'
-        print(msg.format(domains=", ".join(origins), bucket_name=bucket.name))
-        bucket.Cors().put(CORSConfiguration=config)
+        self.echo(msg.format(domains=", ".join(origins), bucket_name=bucket.name))
+        self.backend.put_bucket_cors(bucket.name, config)
 
     def validate_bucket_name(self, bucket_name):
         try:
-            self.s3.meta.client.head_bucket(Bucket=bucket_name)
+            self.backend.head_bucket(bucket_name)
         except ClientError as e:
             # Bucket does not exist, proceed with creation.
             if e.response["Error"]["Code"] == "404":
@@ -252,7 +743,7 @@ class BucketCreator:
 
     def validate_user_name(self, user_name):
         try:
-            self.iam.User(user_name).load()
+            self.backend.get_user(user_name)
         except ClientError as e:
             if e.response["Error"]["Code"] == "ValidationError":
                 raise InvalidUserName(str(e)) from e
@@ -264,9 +755,7 @@ class BucketCreator:
 
     def get_current_user(self):
         try:
-            user = self.iam.CurrentUser()
-            user.load()
-            return user
+            return self.backend.get_current_user()
         except NoCredentialsError as e:
             raise CredentialsNotFound from e
         except ClientError as e:
@@ -276,7 +765,7 @@ class BucketCreator:
 
     def get_current_account_alias(self):
         try:
-            response = self.iam.meta.client.list_account_aliases()
+            aliases = self.backend.list_account_aliases()
         except NoCredentialsError as e:
             raise CredentialsNotFound from e
         except ClientError as e:
@@ -284,6 +773,6 @@ class BucketCreator:
                 raise CannotListAccountAliases from e
             raise e
         try:
-            return response["AccountAliases"][0]
+            return aliases[0]
         except IndexError:
             return
@@ -1,29 +1,108 @@
 import argparse
+import json
+import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from . import __version__
-from .bucket_creator import BucketCreator
+from .account import DEFAULT_TTL as DEFAULT_ACCOUNT_TTL
 from .exceptions import (
+    BucketDoesNotExist,
     BucketNameAlreadyInUse,
-    CannotGetCurrentUser,
-    CannotListAccountAliases,
     CredentialsNotFound,
     InvalidBucketName,
+    InvalidManifest,
     InvalidUserName,
+    PolicyTooLarge,
     UserNameTaken,
 )
+from .retry import RetryPolicy
+from .tracing import Tracer
 from .utils import CommandLineInterface
 
-USER_NAME_FORMAT = "{bucket_name}-s3-owner"
-
 
 class BuckupCommandLineInterface(CommandLineInterface):
-    def __init__(self, boto3_profile=None, boto3_region=None):
+    def __init__(
+        self,
+        boto3_profile=None,
+        boto3_region=None,
+        retry_policy=None,
+        tracer=None,
+        seed_directory=None,
+        seed_concurrency=None,
+        seed_part_size=None,
+        copy_from=None,
+        copy_concurrency=None,
+        noncurrent_version_expiration_days=None,
+        abort_multipart_upload_days=None,
+        intelligent_tiering=False,
+        user_pool=None,
+        account_ttl=DEFAULT_ACCOUNT_TTL,
+        refresh_account=False,
+    ):
+        # Imported here so that "--help" and "--version" don't pay for
+        # importing botocore.
+        from .account import AccountContextCache
+        from .bucket_creator import BucketCreator
+        from .names import BucketNameSuggester
+
         self.bucket_creator = BucketCreator(
-            profile_name=boto3_profile, region_name=boto3_region
+            profile_name=boto3_profile,
+            region_name=boto3_region,
+            retry_policy=retry_policy,
+            tracer=tracer,
+            user_pool=user_pool,
         )
+        self.bucket_name_suggester = BucketNameSuggester(self.bucket_creator)
+        self.account_cache = AccountContextCache(boto3_profile, ttl=account_ttl)
+        self.refresh_account = refresh_account
         self.data = {}
-        self.data["region"] = self.bucket_creator.session.region_name
+        # Resolved with the account details, which may be cached.
+        self.data["region"] = boto3_region
+        if seed_directory:
+            self.data["seed_directory"] = seed_directory
+            self.data["seed_concurrency"] = seed_concurrency
+            self.data["seed_part_size"] = seed_part_size
+        if copy_from:
+            self.data["copy_from"] = copy_from
+            self.data["copy_concurrency"] = copy_concurrency
+        if noncurrent_version_expiration_days:
+            self.data["noncurrent_version_expiration_days"] = (
+                noncurrent_version_expiration_days
+            )
+        if abort_multipart_upload_days:
+            self.data["abort_multipart_upload_days"] = abort_multipart_upload_days
+        if intelligent_tiering:
+            self.data["intelligent_tiering"] = True
+        # AWS lookups are started in the background as soon as their
+        # arguments are known, so the prompts don't wait on AWS latency.
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.lookups = {}
+
+    def start_lookup(self, key, func, *args):
+        if key not in self.lookups:
+            self.lookups[key] = self.executor.submit(func, *args)
+
+    def get_lookup(self, key, func, *args):
+        """
+        Return the result of the lookup started for ``key``, or call
+        ``func`` now if it was not started.
+        """
+        future = self.lookups.get(key)
+        if future is None:
+            return func(*args)
+        return future.result()
+
+    def get_account_context(self):
+        from .account import get_account_context
+
+        return get_account_context(
+            self.bucket_creator, self.account_cache, refresh=self.refresh_account
+        )
+
+    def start_account_lookups(self):
+        self.start_lookup("account_context", self.get_account_context)
 
     def print_welcome_information(self):
         print(r"""
@@ -62,7 +141,9 @@ class BuckupCommandLineInterface(CommandLineInterface):
 
     def print_account_information(self):
         try:
-            current_user = self.bucket_creator.get_current_user()
+            account_context = self.get_lookup(
+                "account_context", self.get_account_context
+            )
         except CredentialsNotFound:
             print(
                 "Credentials not set. Please make sure your AWS credentials "
@@ -83,24 +164,16 @@ class BuckupCommandLineInterface(CommandLineInterface):
             )
             print("Aborted due to an error.")
             sys.exit(1)
-        except CannotGetCurrentUser:
-            # non-essential information
-            pass
-        else:
+        # The user and the alias are non-essential information.
+        if account_context.user_arn:
             print(
                 "Signed in as {user_name}.".format(
-                    user_name=current_user.arn,
+                    user_name=account_context.user_arn,
                 )
             )
-        try:
-            account_alias = self.bucket_creator.get_current_account_alias()
-        except CannotListAccountAliases:
-            # non-essential information
-            pass
-        else:
-            if account_alias:
-                print('You account alias is "{}".'.format(account_alias))
-        region = self.data["region"]
+        if account_context.account_alias:
+            print('You account alias is "{}".'.format(account_context.account_alias))
+        region = self.data["region"] = self.data["region"] or account_context.region
         if not region:
             print('You need to specify region with "--region".')
             sys.exit(1)
@@ -111,30 +184,48 @@ class BuckupCommandLineInterface(CommandLineInterface):
         )
         print("(Ctrl+c to cancel)")
 
+    def get_default_user_name(self):
+        from .bucket_creator import USER_NAME_FORMAT
+
+        return USER_NAME_FORMAT.format(bucket_name=self.data["bucket_name"])
+
     def ask_bucket_name(self):
         bucket_name = self.ask("Bucket name?")
         try:
-            self.bucket_creator.validate_bucket_name(bucket_name)
+            self.bucket_name_suggester.validate(bucket_name)
         except BucketNameAlreadyInUse:
             print("Bucket name already in use...")
+            suggestions = self.bucket_name_suggester.suggest(bucket_name)
+            if suggestions:
+                print("Available names: {}".format(", ".join(suggestions)))
             return self.ask_bucket_name()
         except InvalidBucketName as e:
             print(e)
             return self.ask_bucket_name()
         else:
             self.data["bucket_name"] = bucket_name
+            # Check the default user name while the next questions are
+            # answered.
+            default_user_name = self.get_default_user_name()
+            self.start_lookup(
+                ("validate_user_name", default_user_name),
+                self.bucket_creator.validate_user_name,
+                default_user_name,
+            )
 
     def ask_user_name(self):
-        default_user_name = USER_NAME_FORMAT.format(
-            bucket_name=self.data["bucket_name"]
-        )
+        default_user_name = self.get_default_user_name()
         question = "Username? [{}]".format(default_user_name)
         user_name = self.ask(question)
         if not user_name:
             user_name = default_user_name
 
         try:
-            self.bucket_creator.validate_user_name(user_name)
+            self.get_lookup(
+                ("validate_user_name", user_name),
+                self.bucket_creator.validate_user_name,
+                user_name,
+            )
         except UserNameTaken:
             print("The username is already taken. Try a different one.")
             return self.ask_user_name()
@@ -189,6 +280,13 @@ class BuckupCommandLineInterface(CommandLineInterface):
                 )
                 continue
             elif paths:
+                try:
+                    self.bucket_creator.validate_bucket_policy_size(
+                        self.data["bucket_name"], self.data["user_name"], paths
+                    )
+                except PolicyTooLarge as e:
+                    print("{}\n".format(e))
+                    continue
                 break
         self.data["public_get_object_paths"] = paths
 
@@ -214,7 +312,21 @@ class BuckupCommandLineInterface(CommandLineInterface):
                 self.data["cors_origins"].append(origin)
 
     def create_bucket(self):
-        self.bucket_creator.commit(self.data)
+        from .journal import Journal
+
+        journal = Journal(self.data["bucket_name"])
+        journal.clear()
+        try:
+            self.bucket_creator.commit(self.data, journal=journal)
+        except Exception:
+            print(
+                "\nCreating the bucket failed. Run "
+                '"buckup resume {bucket_name}" to finish it or '
+                '"buckup rollback {bucket_name}" to undo it.\n'.format(
+                    bucket_name=self.data["bucket_name"]
+                )
+            )
+            raise
         self.print_separator()
         print(
             "Bucket created. Please keep the above credentials secret as "
@@ -228,25 +340,650 @@ class BuckupCommandLineInterface(CommandLineInterface):
         print()
 
     def execute(self):
-        self.print_welcome_information()
-        self.print_separator()
-        self.print_account_information()
-        self.print_separator()
-        self.ask_bucket_name()
-        self.ask_user_name()
-        self.ask_enable_versioning()
-        self.ask_public_get_object()
-        self.ask_public_acl()
-        self.ask_cors()
-        self.print_separator()
-        if self.ask_summary():
+        self.start_account_lookups()
+        try:
+            self.print_welcome_information()
+            self.print_separator()
+            self.print_account_information()
+            self.print_separator()
+            self.ask_bucket_name()
+            self.ask_user_name()
+            self.ask_enable_versioning()
+            self.ask_public_get_object()
+            self.ask_public_acl()
+            self.ask_cors()
             self.print_separator()
+            if self.ask_summary():
+                self.print_separator()
+                print(
+                    "Warning: The following information contains sensitive "
+                    "values. Be careful when copying and pasting."
+                )
+                self.print_separator()
+                self.create_bucket()
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_user_pool(args, tracer=None, replace=False):
+    """
+    Return the warm pool of spare users asked for with "--warm-pool",
+    started in the background, or ``None``. Claimed spares are only
+    replaced if ``replace`` is true: a one-shot run would exit before its
+    replacements are usable, so it leaves that to "buckup warm-pool".
+    """
+    if not args.warm_pool:
+        return None
+    from .bucket_creator import BucketCreator
+    from .warmpool import WarmUserPool
+
+    bucket_creator = BucketCreator(
+        profile_name=args.profile,
+        region_name=args.region,
+        quiet=True,
+        retry_policy=RetryPolicy(deadline=args.max_wait),
+        tracer=tracer,
+    )
+    return WarmUserPool(bucket_creator, size=args.warm_pool, replace=replace).start()
+
+
+def provision(specs, args, tracer=None, resume=False):
+    from .batch import BatchProvisioner
+    from .journal import Journal
+
+    user_pool = get_user_pool(args, tracer=tracer)
+    provisioner = BatchProvisioner(
+        profile_name=args.profile,
+        region_name=args.region,
+        max_workers=args.concurrency,
+        retry_policy=RetryPolicy(deadline=args.max_wait),
+        tracer=tracer,
+        resume=resume,
+        user_pool=user_pool,
+    )
+    try:
+        print(
+            "Provisioning {count} buckets with up to {concurrency} at a time.".format(
+                count=len(specs), concurrency=args.concurrency
+            )
+        )
+        start = time.monotonic()
+        failed = []
+        for result in provisioner.run(specs):
+            if not result.ok:
+                failed.append(result.bucket_name)
+                print(
+                    '[failed] "{bucket_name}" after {duration:.1f}s: {error}'.format(
+                        bucket_name=result.bucket_name,
+                        duration=result.duration,
+                        error=result.error,
+                    )
+                )
+                continue
             print(
-                "Warning: The following information contains sensitive values. "
-                "Be careful when copying and pasting."
+                '[ok] "{bucket_name}" in {duration:.1f}s'.format(
+                    bucket_name=result.bucket_name, duration=result.duration
+                )
             )
-            self.print_separator()
-            self.create_bucket()
+            print("\tAWS_STORAGE_BUCKET_NAME='{bucket_name}'".format(**result.result))
+            print("\tAWS_ACCESS_KEY_ID='{access_key_id}'".format(**result.result))
+            print(
+                "\tAWS_SECRET_ACCESS_KEY='{secret_access_key}'".format(**result.result)
+            )
+        print()
+        print(
+            "Provisioned {succeeded} of {count} buckets in {duration:.1f}s.".format(
+                succeeded=len(specs) - len(failed),
+                count=len(specs),
+                duration=time.monotonic() - start,
+            )
+        )
+        unfinished = [
+            bucket_name for bucket_name in failed if Journal(bucket_name).exists()
+        ]
+        if unfinished:
+            print(
+                'Run "buckup resume {bucket_names}" to finish the failed buckets '
+                'or "buckup rollback {bucket_names}" to undo them.'.format(
+                    bucket_names=" ".join(unfinished)
+                )
+            )
+        if failed:
+            sys.exit(1)
+    finally:
+        if user_pool is not None:
+            user_pool.close()
+
+
+def apply_manifest(args, tracer=None):
+    from .batch import load_manifest
+
+    try:
+        specs = load_manifest(args.manifest)
+    except (OSError, InvalidManifest) as e:
+        print("Cannot read the manifest: {}".format(e))
+        sys.exit(1)
+    provision(specs, args, tracer=tracer, resume=args.resume)
+
+
+def check_bucket_names(bucket_names):
+    """
+    Exit if a bucket name given on the command line is invalid, before it is
+    used in the path of a journal.
+    """
+    from .backends import check_bucket_name
+
+    for bucket_name in bucket_names:
+        try:
+            check_bucket_name(bucket_name)
+        except InvalidBucketName as e:
+            print(e)
+            sys.exit(1)
+
+
+def resume_buckets(args, tracer=None):
+    from .batch import build_spec
+    from .journal import Journal
+
+    if not args.bucket_names:
+        bucket_names = Journal.list_bucket_names()
+        if not bucket_names:
+            print("There are no unfinished buckets.")
+            return
+        print("Unfinished buckets:")
+        for bucket_name in bucket_names:
+            print("\t{}".format(bucket_name))
+        return
+    check_bucket_names(args.bucket_names)
+    specs = []
+    for bucket_name in args.bucket_names:
+        journal = Journal(bucket_name)
+        if not journal.exists():
+            print('There is nothing to resume for "{}".'.format(bucket_name))
+            sys.exit(1)
+        specs.append(build_spec(journal.spec))
+    provision(specs, args, tracer=tracer, resume=True)
+
+
+def rollback_buckets(args, tracer=None):
+    from .bucket_creator import BucketCreator
+    from .journal import Journal, rollback
+
+    check_bucket_names(args.bucket_names)
+    journals = [Journal(bucket_name) for bucket_name in args.bucket_names]
+    for journal in journals:
+        if not journal.exists():
+            print('There is nothing to roll back for "{}".'.format(journal.bucket_name))
+            sys.exit(1)
+    if not args.yes and not CommandLineInterface().ask_yes_no(
+        "This will permanently delete {} and the users created for them. "
+        "Continue?".format(", ".join(args.bucket_names))
+    ):
+        print("Cancelled.")
+        sys.exit(130)
+    bucket_creator = BucketCreator(
+        profile_name=args.profile, region_name=args.region, tracer=tracer
+    )
+    for journal in journals:
+        rollback(bucket_creator, journal)
+
+
+def reconcile_manifest(args, tracer=None):
+    from .batch import load_manifest
+    from .bucket_creator import BucketCreator
+    from .pool import DEFAULT_MAX_POOL_CONNECTIONS, ClientPool
+    from .reconcile import Reconciler
+
+    try:
+        # Settings a spec leaves out are left as they are.
+        specs = load_manifest(args.manifest, fill_defaults=False)
+    except (OSError, InvalidManifest) as e:
+        print("Cannot read the manifest: {}".format(e))
+        sys.exit(1)
+    reconciler = Reconciler(
+        BucketCreator(
+            profile_name=args.profile,
+            region_name=args.region,
+            quiet=True,
+            tracer=tracer,
+            pool=ClientPool(
+                max_pool_connections=max(
+                    DEFAULT_MAX_POOL_CONNECTIONS, args.concurrency * 5
+                ),
+                tracer=tracer,
+            ),
+        )
+    )
+    failed = 0
+    changed = 0
+    for result in reconciler.run(
+        specs, max_workers=args.concurrency, dry_run=args.dry_run
+    ):
+        if not result.ok:
+            failed += 1
+            print(
+                '[failed] "{bucket_name}": {error}'.format(
+                    bucket_name=result.bucket_name, error=result.error
+                )
+            )
+            continue
+        if not result.result:
+            print('[unchanged] "{}"'.format(result.bucket_name))
+            continue
+        changed += 1
+        print(
+            '[{status}] "{bucket_name}"'.format(
+                status="plan" if args.dry_run else "changed",
+                bucket_name=result.bucket_name,
+            )
+        )
+        for change in result.result:
+            print("\t{}".format(change))
+    print()
+    print(
+        "{changed} of {count} buckets {verb}, {failed} failed.".format(
+            changed=changed,
+            count=len(specs),
+            verb="need changes" if args.dry_run else "changed",
+            failed=failed,
+        )
+    )
+    if failed:
+        sys.exit(1)
+
+
+def destroy_bucket(args, tracer=None):
+    from .bucket_creator import USER_NAME_FORMAT, BucketCreator
+    from .teardown import BucketDestroyer
+
+    user_name = args.user_name or USER_NAME_FORMAT.format(bucket_name=args.bucket_name)
+    if args.keep_user:
+        user_name = ""
+    if not args.yes:
+        print(
+            'This will permanently delete bucket "{bucket_name}" with every '
+            "object version in it{user}.".format(
+                bucket_name=args.bucket_name,
+                user=' and IAM user "{}"'.format(user_name) if user_name else "",
+            )
+        )
+        answer = CommandLineInterface().ask("Type the bucket name to confirm.")
+        if answer != args.bucket_name:
+            print("Cancelled.")
+            sys.exit(130)
+    destroyer = BucketDestroyer(
+        BucketCreator(
+            profile_name=args.profile, region_name=args.region, tracer=tracer
+        ),
+        max_workers=args.concurrency,
+    )
+    start = time.monotonic()
+    try:
+        destroyer.destroy(args.bucket_name, user_name=user_name)
+    except BucketDoesNotExist as e:
+        print(e)
+        sys.exit(1)
+    print("Done in {:.1f}s.".format(time.monotonic() - start))
+
+
+def print_inventory(args, tracer=None):
+    from .bucket_creator import BucketCreator
+    from .inventory import InventoryCache, InventoryScanner
+    from .pool import DEFAULT_MAX_POOL_CONNECTIONS, ClientPool
+
+    cache = InventoryCache(ttl=args.ttl)
+    scanner = InventoryScanner(
+        BucketCreator(
+            profile_name=args.profile,
+            region_name=args.region,
+            quiet=True,
+            tracer=tracer,
+            pool=ClientPool(
+                max_pool_connections=max(
+                    DEFAULT_MAX_POOL_CONNECTIONS, args.concurrency * 5
+                ),
+                tracer=tracer,
+            ),
+        ),
+        cache,
+        max_workers=args.concurrency,
+    )
+    try:
+        records = scanner.scan(refresh=args.refresh)
+    finally:
+        cache.close()
+    # Buckets that can't be read may be buckup's, so they are always listed.
+    if not args.all:
+        records = [
+            record for record in records if record.is_buckup or "error" in record.state
+        ]
+    unreadable = [record for record in records if "error" in record.state]
+    if args.json:
+        print(json.dumps([record.as_json() for record in records], indent=2))
+        if unreadable:
+            print(
+                "{} buckets could not be read.".format(len(unreadable)),
+                file=sys.stderr,
+            )
+        return
+    for record in records:
+        state = record.state
+        if "error" in state:
+            print("{}\tcannot read: {}".format(record.bucket_name, state["error"]))
+            continue
+        print(
+            "{bucket_name}\t{region}\tversioning: {versioning}\t"
+            "public access: {public_access}\tcors: {cors}\t"
+            "public paths: {public_paths}".format(
+                bucket_name=record.bucket_name,
+                region=state["region"],
+                public_access=record.public_access,
+                versioning=state["versioning"] or "Disabled",
+                cors=", ".join(record.cors_origins) or "-",
+                public_paths=", ".join(record.public_get_object_paths) or "-",
+            )
+        )
+    print()
+    print(
+        "{count} {kind}buckets.".format(
+            count=len(records) - len(unreadable), kind="" if args.all else "buckup "
+        )
+    )
+    if unreadable:
+        print("{} buckets could not be read.".format(len(unreadable)))
+
+
+def rotate_keys(args, tracer=None):
+    from .bucket_creator import BucketCreator
+    from .rotation import KeyRotator
+
+    rotator = KeyRotator(
+        BucketCreator(
+            profile_name=args.profile,
+            region_name=args.region,
+            quiet=True,
+            tracer=tracer,
+        ),
+        max_workers=args.concurrency,
+        rate=args.rate,
+    )
+    user_names = args.user_names or rotator.discover_user_names()
+    # New keys go to stdout as JSON lines, everything else to stderr.
+    print("Rotating access keys of {} users.".format(len(user_names)), file=sys.stderr)
+    rotated = []
+    failed = 0
+    for result in rotator.run(user_names):
+        print(json.dumps(result.as_json()), flush=True)
+        if result.ok:
+            rotated.append(result)
+        else:
+            failed += 1
+    if rotated and (args.deactivate_old or args.delete_old):
+        if args.grace_period:
+            print(
+                "Waiting {} seconds before retiring the old keys.".format(
+                    args.grace_period
+                ),
+                file=sys.stderr,
+            )
+        for result in rotator.retire_all(
+            rotated, grace_period=args.grace_period, delete=args.delete_old
+        ):
+            failed += 1
+            print(
+                'Cannot retire the old keys of "{user_name}": {error}'.format(
+                    user_name=result.user_name, error=result.error
+                ),
+                file=sys.stderr,
+            )
+    print(
+        "{rotated} of {count} users rotated, {failed} failed.".format(
+            rotated=len(rotated), count=len(user_names), failed=failed
+        ),
+        file=sys.stderr,
+    )
+    if failed:
+        sys.exit(1)
+
+
+def read_spec(args):
+    """
+    Build the bucket spec of "create" from the "--spec" JSON document and
+    the flags, which take precedence.
+    """
+    from .batch import build_spec
+
+    spec = {}
+    if args.spec:
+        try:
+            if args.spec == "-":
+                spec = json.load(sys.stdin)
+            else:
+                with open(args.spec) as f:
+                    spec = json.load(f)
+        except ValueError as e:
+            raise InvalidManifest(str(e)) from e
+        if not isinstance(spec, dict):
+            raise InvalidManifest("The spec must be a JSON object.")
+    flags = {
+        "bucket_name": args.bucket_name,
+        "user_name": args.user_name,
+        "allow_public_acls": args.allow_public_acls,
+        "public_get_object_paths": args.public_paths,
+        "cors_origins": args.cors_origins,
+        "enable_versioning": args.enable_versioning,
+    }
+    if args.seed_from:
+        flags.update(
+            seed_directory=args.seed_from,
+            seed_concurrency=args.seed_concurrency,
+            seed_part_size=args.seed_part_size,
+        )
+    if args.copy_from:
+        flags.update(copy_from=args.copy_from, copy_concurrency=args.copy_concurrency)
+    flags.update(
+        noncurrent_version_expiration_days=args.noncurrent_version_expiration,
+        abort_multipart_upload_days=args.abort_multipart_after,
+        intelligent_tiering=args.intelligent_tiering,
+    )
+    spec.update((key, value) for key, value in flags.items() if value is not None)
+    return build_spec(spec, region=args.region)
+
+
+def create_from_spec(args, tracer=None):
+    from .bucket_creator import BucketCreator
+    from .events import EventWriter
+    from .journal import Journal
+
+    # Events go to stdout as JSON lines, the moment they happen.
+    events = EventWriter()
+    try:
+        spec = read_spec(args)
+    except (OSError, InvalidManifest) as e:
+        events.write("failed", error="Cannot read the spec: {}".format(e))
+        sys.exit(1)
+    bucket_name = spec["bucket_name"]
+    user_pool = get_user_pool(args, tracer=tracer)
+    journal = Journal(bucket_name)
+    try:
+        bucket_creator = BucketCreator(
+            profile_name=args.profile,
+            region_name=spec["region"] or args.region,
+            quiet=True,
+            retry_policy=RetryPolicy(deadline=args.max_wait),
+            tracer=tracer,
+            user_pool=user_pool,
+        )
+        if not spec["region"]:
+            spec["region"] = bucket_creator.backend.region_name
+        bucket_creator.validate_bucket_name(bucket_name)
+        bucket_creator.validate_user_name(spec["user_name"])
+        journal.clear()
+        events.write(
+            "started",
+            bucket_name=bucket_name,
+            user_name=spec["user_name"],
+            region=spec["region"],
+        )
+        result = bucket_creator.commit(spec, journal=journal, on_step=events.on_step)
+    except Exception as e:
+        events.write(
+            "failed",
+            bucket_name=bucket_name,
+            error=str(e) or type(e).__name__,
+            resumable=journal.exists(),
+        )
+        sys.exit(1)
+    finally:
+        if user_pool is not None:
+            user_pool.close()
+    for key in ("seed_report", "copy_report"):
+        if key in result:
+            result[key] = result[key].as_json()
+    events.write("succeeded", **result)
+
+
+def serve(args, tracer=None):
+    from .server import create_server
+
+    token = os.environ.get("BUCKUP_SERVE_TOKEN")
+    if not token and not args.insecure_no_token:
+        print(
+            "Set BUCKUP_SERVE_TOKEN to the token clients must send, or pass "
+            "--insecure-no-token to accept any client."
+        )
+        sys.exit(1)
+    user_pool = get_user_pool(args, tracer=tracer, replace=True)
+    server = create_server(
+        host=args.host,
+        port=args.port,
+        profile_name=args.profile,
+        region_name=args.region,
+        max_workers=args.concurrency,
+        retry_policy=RetryPolicy(deadline=args.max_wait),
+        tracer=tracer,
+        user_pool=user_pool,
+        token=token,
+        quiet=args.quiet,
+    )
+    print(
+        "Serving on http://{host}:{port} with up to {concurrency} jobs at a "
+        "time.".format(
+            host=server.server_address[0],
+            port=server.server_address[1],
+            concurrency=args.concurrency,
+        )
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.service.close()
+        if user_pool is not None:
+            user_pool.close()
+
+
+def fill_warm_pool(args, tracer=None):
+    from .bucket_creator import BucketCreator
+    from .warmpool import WarmUserPool
+
+    user_pool = WarmUserPool(
+        BucketCreator(
+            profile_name=args.profile,
+            region_name=args.region,
+            retry_policy=RetryPolicy(deadline=args.max_wait),
+            tracer=tracer,
+        ),
+        size=args.size,
+    )
+    try:
+        if args.drain:
+            print("Deleted {} spare users.".format(user_pool.drain()))
+            return
+        print("Creating spare users, this can take a minute.")
+        print("{} spare users ready.".format(user_pool.fill()))
+    finally:
+        user_pool.close()
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return number
+
+
+def non_negative_int(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError("must be at least 0")
+    return number
+
+
+def add_spec_arguments(parser, defaults=True):
+    """
+    Add the flags setting what a new bucket is seeded with and its lifecycle.
+    They are global, and repeated on "create" without defaults so that they
+    don't override the global ones.
+    """
+
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser.add_argument(
+        "--seed-from",
+        type=str,
+        default=default(None),
+        metavar="DIRECTORY",
+        help="Upload the contents of DIRECTORY into the new bucket.",
+    )
+    parser.add_argument(
+        "--seed-concurrency",
+        type=positive_int,
+        default=default(10),
+        help='How many requests "--seed-from" makes at the same time (default: 10).',
+    )
+    parser.add_argument(
+        "--seed-part-size",
+        type=positive_int,
+        default=default(8),
+        metavar="MB",
+        help='Size of multipart upload parts for "--seed-from" (default: 8).',
+    )
+    parser.add_argument(
+        "--copy-from",
+        type=str,
+        default=default(None),
+        metavar="BUCKET[/PREFIX]",
+        help="Copy the objects of an existing bucket, or of a prefix in it, "
+        "into the new bucket without downloading them.",
+    )
+    parser.add_argument(
+        "--copy-concurrency",
+        type=positive_int,
+        default=default(10),
+        help='How many objects "--copy-from" copies at the same time (default: 10).',
+    )
+    parser.add_argument(
+        "--noncurrent-version-expiration",
+        type=positive_int,
+        default=default(None),
+        metavar="DAYS",
+        help="Delete object versions DAYS days after they stop being current.",
+    )
+    parser.add_argument(
+        "--abort-multipart-after",
+        type=positive_int,
+        default=default(None),
+        metavar="DAYS",
+        help="Abort multipart uploads still incomplete after DAYS days.",
+    )
+    parser.add_argument(
+        "--intelligent-tiering",
+        action="store_true",
+        default=default(None),
+        help="Store objects in the S3 Intelligent-Tiering storage class.",
+    )
 
 
 def parse_args():
@@ -264,17 +1001,358 @@ def parse_args():
         "your default region from the local session if "
         "not specified.",
     )
+    parser.add_argument(
+        "--max-wait",
+        type=positive_int,
+        default=120,
+        help="How many seconds to wait for AWS to make new buckets and users "
+        "available before giving up (default: 120).",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        metavar="FILE",
+        help="Write the duration of every step and AWS API call to FILE.",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=["json", "chrome"],
+        default="json",
+        help='Format of the "--trace" file (default: json).',
+    )
+    add_spec_arguments(parser)
+    parser.add_argument(
+        "--refresh",
+        dest="refresh_account",
+        action="store_true",
+        help="Look up the signed in user and account alias again instead of "
+        "using the cached ones.",
+    )
+    parser.add_argument(
+        "--account-ttl",
+        type=positive_int,
+        default=DEFAULT_ACCOUNT_TTL,
+        metavar="SECONDS",
+        help="How long the signed in user and account alias are cached "
+        "(default: 86400).",
+    )
+    parser.add_argument(
+        "--warm-pool",
+        type=non_negative_int,
+        default=0,
+        metavar="SIZE",
+        help="Claim users from a pool of SIZE spare IAM users created ahead of "
+        'time with "buckup warm-pool". "serve" replaces the spares it claims '
+        "in the background. 0, the default, creates new users instead.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    apply_parser = subparsers.add_parser(
+        "apply", help="Create every bucket listed in a JSON or YAML manifest."
+    )
+    apply_parser.add_argument(
+        "manifest", type=str, help="Path to the manifest file (.json or .yaml)"
+    )
+    apply_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="How many buckets to create at the same time (default: 4).",
+    )
+    apply_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Finish buckets left unfinished by an earlier run, skipping the "
+        "steps that completed.",
+    )
+    resume_parser = subparsers.add_parser(
+        "resume",
+        help="Finish creating buckets after a failure, skipping the steps "
+        "that completed.",
+    )
+    resume_parser.add_argument(
+        "bucket_names",
+        nargs="*",
+        metavar="BUCKET",
+        help="Buckets to finish. Lists the unfinished buckets if not given.",
+    )
+    resume_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="How many buckets to finish at the same time (default: 4).",
+    )
+    rollback_parser = subparsers.add_parser(
+        "rollback",
+        help="Delete what a failed attempt to create buckets left behind.",
+    )
+    rollback_parser.add_argument(
+        "bucket_names", nargs="+", metavar="BUCKET", help="Buckets to roll back"
+    )
+    rollback_parser.add_argument(
+        "--yes", action="store_true", help="Do not ask for confirmation."
+    )
+    reconcile_parser = subparsers.add_parser(
+        "reconcile",
+        help="Update existing buckets listed in a manifest to match it.",
+    )
+    reconcile_parser.add_argument(
+        "manifest", type=str, help="Path to the manifest file (.json or .yaml)"
+    )
+    reconcile_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only show the changes that would be made.",
+    )
+    reconcile_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=8,
+        help="How many buckets to check at the same time (default: 8).",
+    )
+    destroy_parser = subparsers.add_parser(
+        "destroy",
+        help="Delete a bucket with all its object versions and its user.",
+    )
+    destroy_parser.add_argument("bucket_name", type=str, help="Bucket to delete")
+    destroy_parser.add_argument(
+        "--user-name",
+        type=str,
+        help="User to delete. Defaults to the user buckup creates for the bucket.",
+    )
+    destroy_parser.add_argument(
+        "--keep-user", action="store_true", help="Do not delete the user."
+    )
+    destroy_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=8,
+        help="How many batches of 1000 object versions to delete at the same "
+        "time (default: 8).",
+    )
+    destroy_parser.add_argument(
+        "--yes", action="store_true", help="Do not ask for confirmation."
+    )
+    rotate_parser = subparsers.add_parser(
+        "rotate-keys",
+        help="Create new access keys for users and retire their old keys.",
+    )
+    rotate_parser.add_argument(
+        "user_names",
+        nargs="*",
+        metavar="USER_NAME",
+        help="Users to rotate. Defaults to every user buckup created.",
+    )
+    rotate_parser.add_argument(
+        "--deactivate-old",
+        action="store_true",
+        help="Deactivate the old keys once the new ones are created.",
+    )
+    rotate_parser.add_argument(
+        "--delete-old",
+        action="store_true",
+        help="Deactivate and delete the old keys once the new ones are created.",
+    )
+    rotate_parser.add_argument(
+        "--grace-period",
+        type=non_negative_int,
+        default=0,
+        metavar="SECONDS",
+        help="How long to wait before retiring the old keys (default: 0).",
+    )
+    rotate_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="How many users to rotate at the same time (default: 4).",
+    )
+    rotate_parser.add_argument(
+        "--rate",
+        type=positive_int,
+        default=5,
+        help="Maximum number of IAM calls per second (default: 5).",
+    )
+    warm_pool_parser = subparsers.add_parser(
+        "warm-pool",
+        help='Create the spare users used by "--warm-pool" and wait until they '
+        "are usable.",
+    )
+    warm_pool_parser.add_argument(
+        "--size",
+        type=positive_int,
+        default=5,
+        help="How many spare users to keep (default: 5).",
+    )
+    warm_pool_parser.add_argument(
+        "--drain", action="store_true", help="Delete every spare user instead."
+    )
+    create_parser = subparsers.add_parser(
+        "create",
+        help="Create a bucket without asking questions, printing the result "
+        "of every step as a JSON line as soon as it completes.",
+    )
+    create_parser.add_argument(
+        "bucket_name", nargs="?", metavar="BUCKET", help="Bucket to create"
+    )
+    create_parser.add_argument(
+        "--spec",
+        type=str,
+        metavar="FILE",
+        help='Read the bucket spec from a JSON file, or from stdin with "-". '
+        "Flags override its values.",
+    )
+    create_parser.add_argument(
+        "--user-name",
+        type=str,
+        help='User to create. Defaults to the bucket name followed by "-s3-owner".',
+    )
+    create_parser.add_argument(
+        "--allow-public-acls",
+        action="store_true",
+        default=None,
+        help="Allow public ACLs on objects.",
+    )
+    create_parser.add_argument(
+        "--public-path",
+        dest="public_paths",
+        action="append",
+        metavar="PATH",
+        help='Allow the public to get objects under PATH, e.g. "documents/*". '
+        "Can be given more than once.",
+    )
+    create_parser.add_argument(
+        "--cors-origin",
+        dest="cors_origins",
+        action="append",
+        metavar="ORIGIN",
+        help="Allow GET requests from ORIGIN. Can be given more than once.",
+    )
+    create_parser.add_argument(
+        "--enable-versioning",
+        action="store_true",
+        default=None,
+        help="Enable versioning.",
+    )
+    add_spec_arguments(create_parser, defaults=False)
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Run an HTTP API that provisions buckets from JSON specs and "
+        "exposes Prometheus metrics.",
+    )
+    serve_parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Address to listen on (default: 127.0.0.1).",
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=8080, help="Port to listen on (default: 8080)."
+    )
+    serve_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=4,
+        help="How many buckets to create at the same time (default: 4).",
+    )
+    serve_parser.add_argument(
+        "--quiet", action="store_true", help="Do not log every request."
+    )
+    serve_parser.add_argument(
+        "--insecure-no-token",
+        action="store_true",
+        help="Serve without BUCKUP_SERVE_TOKEN, letting any client that can "
+        "connect create buckets and read their credentials.",
+    )
+    inventory_parser = subparsers.add_parser(
+        "inventory",
+        help="List the buckets created by buckup and how they are configured.",
+    )
+    inventory_parser.add_argument(
+        "--all", action="store_true", help="Include buckets not created by buckup."
+    )
+    inventory_parser.add_argument(
+        "--json", action="store_true", help="Print the buckets as JSON."
+    )
+    inventory_parser.add_argument(
+        "--ttl",
+        type=int,
+        default=3600,
+        metavar="SECONDS",
+        help="How long cached bucket details are used before they are read "
+        "again (default: 3600).",
+    )
+    inventory_parser.add_argument(
+        "--refresh", action="store_true", help="Ignore the cache."
+    )
+    inventory_parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        default=16,
+        help="How many buckets to read at the same time (default: 16).",
+    )
     return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    tracer = Tracer() if args.trace else None
     try:
-        args = parse_args()
+        if args.command == "apply":
+            apply_manifest(args, tracer=tracer)
+            return
+        if args.command == "resume":
+            resume_buckets(args, tracer=tracer)
+            return
+        if args.command == "rollback":
+            rollback_buckets(args, tracer=tracer)
+            return
+        if args.command == "reconcile":
+            reconcile_manifest(args, tracer=tracer)
+            return
+        if args.command == "destroy":
+            destroy_bucket(args, tracer=tracer)
+            return
+        if args.command == "rotate-keys":
+            rotate_keys(args, tracer=tracer)
+            return
+        if args.command == "inventory":
+            print_inventory(args, tracer=tracer)
+            return
+        if args.command == "create":
+            create_from_spec(args, tracer=tracer)
+            return
+        if args.command == "serve":
+            serve(args, tracer=tracer)
+            return
+        if args.command == "warm-pool":
+            fill_warm_pool(args, tracer=tracer)
+            return
+        user_pool = get_user_pool(args, tracer=tracer)
         cli = BuckupCommandLineInterface(
-            boto3_profile=args.profile, boto3_region=args.region
+            boto3_profile=args.profile,
+            boto3_region=args.region,
+            retry_policy=RetryPolicy(deadline=args.max_wait),
+            tracer=tracer,
+            seed_directory=args.seed_from,
+            seed_concurrency=args.seed_concurrency,
+            seed_part_size=args.seed_part_size,
+            copy_from=args.copy_from,
+            copy_concurrency=args.copy_concurrency,
+            noncurrent_version_expiration_days=args.noncurrent_version_expiration,
+            abort_multipart_upload_days=args.abort_multipart_after,
+            intelligent_tiering=args.intelligent_tiering,
+            user_pool=user_pool,
+            account_ttl=args.account_ttl,
+            refresh_account=args.refresh_account,
         )
-        cli.execute()
+        try:
+            cli.execute()
+        finally:
+            if user_pool is not None:
+                user_pool.close()
     except KeyboardInterrupt:
         print()
         print("Aborted by user.")
         sys.exit(130)
+    finally:
+        if tracer is not None:
+            tracer.write(args.trace, args.trace_format)
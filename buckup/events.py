@@ -0,0 +1,48 @@
+import json
+import sys
+import threading
+import time
+
+
+def get_step_data(name, result):
+    """
+    Return what a step of ``BucketCreator.commit`` produced, as JSON.
+    """
+    if name == "create_bucket":
+        return {"bucket_name": result.name, "location": result.location}
+    if name == "create_user":
+        return {"user_name": result.name, "user_arn": result.arn}
+    if name == "create_access_key_pair":
+        return {
+            "access_key_id": result.access_key_id,
+            "secret_access_key": result.secret_access_key,
+        }
+    if name == "set_bucket_policy":
+        return {"policy": json.loads(result)}
+    if name in ("seed_directory", "copy_from"):
+        return {"report": result.as_json()}
+    return {}
+
+
+class EventWriter:
+    """
+    Write events as JSON lines, flushing each one so that readers get it as
+    soon as it happens. Safe to share between threads.
+    """
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def write(self, event, **data):
+        line = json.dumps(dict(event=event, time=time.time(), **data), default=str)
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def on_step(self, name, result):
+        """
+        Write a "step" event, for use as the ``on_step`` of
+        ``BucketCreator.commit``.
+        """
+        self.write("step", step=name, **get_step_data(name, result))
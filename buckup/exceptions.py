@@ -24,3 +24,23 @@ class CannotListAccountAliases(RuntimeError):
 
 class CannotGetCurrentUser(RuntimeError):
     pass
+
+
+class InvalidManifest(ValueError):
+    pass
+
+
+class RetryDeadlineExceeded(RuntimeError):
+    pass
+
+
+class BucketDoesNotExist(ValueError):
+    pass
+
+
+class UserDoesNotExist(ValueError):
+    pass
+
+
+class PolicyTooLarge(ValueError):
+    pass
@@ -0,0 +1,253 @@
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+
+from .account import get_credentials_key
+from .bucket_creator import USER_NAME_FORMAT
+from .exceptions import BucketDoesNotExist
+from .reconcile import Reconciler, get_public_get_object_paths
+from .tracing import get_error_code
+from .utils import get_cache_dir
+
+DEFAULT_TTL = 3600
+BUCKUP_POLICY_SIDS = frozenset(
+    ["AllowUserManageBucket", "AllowUserManageBucketObjects"]
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    account TEXT PRIMARY KEY,
+    bucket_names TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    account TEXT NOT NULL,
+    bucket_name TEXT NOT NULL,
+    is_buckup INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (account, bucket_name)
+);
+"""
+
+
+class BucketRecord:
+    def __init__(self, bucket_name, is_buckup, state, fetched_at):
+        self.bucket_name = bucket_name
+        self.is_buckup = is_buckup
+        self.state = state
+        self.fetched_at = fetched_at
+
+    @property
+    def cors_origins(self):
+        return [
+            origin
+            for rule in self.state.get("cors") or []
+            for origin in rule.get("AllowedOrigins", [])
+        ]
+
+    @property
+    def public_access(self):
+        configuration = self.state.get("public_access_block")
+        if not configuration or not any(configuration.values()):
+            return "open"
+        if all(configuration.values()):
+            return "blocked"
+        return "partial"
+
+    @property
+    def public_get_object_paths(self):
+        return get_public_get_object_paths(self.state.get("policy"))
+
+    def as_json(self):
+        return {
+            "bucket_name": self.bucket_name,
+            "is_buckup": self.is_buckup,
+            "fetched_at": self.fetched_at,
+            **self.state,
+        }
+
+
+class InventoryCache:
+    """
+    Bucket states stored in SQLite, keyed by the AWS credentials they were
+    read with.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL):
+        self.path = path or os.path.join(get_cache_dir(), "inventory.sqlite3")
+        self.ttl = ttl
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def is_fresh(self, fetched_at, now=None):
+        return (now or time.time()) - fetched_at < self.ttl
+
+    def get_bucket_names(self, account):
+        """
+        Return the cached list of bucket names, or ``None`` if it is stale.
+        """
+        row = self.connection.execute(
+            "SELECT bucket_names, fetched_at FROM listings WHERE account = ?",
+            (account,),
+        ).fetchone()
+        if row is None or not self.is_fresh(row[1]):
+            return None
+        return json.loads(row[0])
+
+    def set_bucket_names(self, account, bucket_names):
+        """
+        Record the listing and forget buckets that are no longer in it.
+        """
+        removed = set(self.get_records(account)) - set(bucket_names)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO listings (account, bucket_names, fetched_at) "
+                "VALUES (?, ?, ?)",
+                (account, json.dumps(bucket_names), time.time()),
+            )
+            self.connection.executemany(
+                "DELETE FROM buckets WHERE account = ? AND bucket_name = ?",
+                [(account, bucket_name) for bucket_name in removed],
+            )
+
+    def get_records(self, account):
+        rows = self.connection.execute(
+            "SELECT bucket_name, is_buckup, state, fetched_at FROM buckets "
+            "WHERE account = ? ORDER BY bucket_name",
+            (account,),
+        )
+        return {
+            bucket_name: BucketRecord(
+                bucket_name, bool(is_buckup), json.loads(state), fetched_at
+            )
+            for bucket_name, is_buckup, state, fetched_at in rows
+        }
+
+    def set_record(self, account, record):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO buckets "
+                "(account, bucket_name, is_buckup, state, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    account,
+                    record.bucket_name,
+                    int(record.is_buckup),
+                    json.dumps(record.state),
+                    record.fetched_at,
+                ),
+            )
+
+    def delete_record(self, account, bucket_name):
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM buckets WHERE account = ? AND bucket_name = ?",
+                (account, bucket_name),
+            )
+
+
+class InventoryScanner:
+    """
+    List the buckets of an account and read how each one is configured,
+    only asking AWS about buckets whose cached state is stale.
+    """
+
+    def __init__(self, bucket_creator, cache, max_workers=16):
+        self.bucket_creator = bucket_creator
+        self.reconciler = Reconciler(bucket_creator)
+        self.cache = cache
+        self.max_workers = max_workers
+
+    @property
+    def account(self):
+        return get_credentials_key(self.bucket_creator.profile_name)
+
+    def list_bucket_names(self):
+        response = self.bucket_creator.s3_client.list_buckets()
+        return sorted(bucket["Name"] for bucket in response["Buckets"])
+
+    def list_user_names(self):
+        paginator = self.bucket_creator.iam.meta.client.get_paginator("list_users")
+        return {
+            user["UserName"] for page in paginator.paginate() for user in page["Users"]
+        }
+
+    def read_region(self, bucket_name):
+        response = self.bucket_creator.s3_client.get_bucket_location(Bucket=bucket_name)
+        # Buckets in us-east-1 have no location constraint.
+        return response.get("LocationConstraint") or "us-east-1"
+
+    def is_buckup_bucket(self, bucket_name, state, user_names):
+        if USER_NAME_FORMAT.format(bucket_name=bucket_name) in user_names:
+            return True
+        policy = state.get("policy") or {}
+        return any(
+            statement.get("Sid") in BUCKUP_POLICY_SIDS
+            for statement in policy.get("Statement", [])
+        )
+
+    def read_state(self, bucket_name):
+        state = self.reconciler.read_state(bucket_name)
+        state["region"] = self.read_region(bucket_name)
+        return state
+
+    def scan(self, refresh=False):
+        """
+        Return a record for every bucket in the account, reading buckets
+        that are not cached or whose cached state is older than the TTL.
+        """
+        bucket_names = None if refresh else self.cache.get_bucket_names(self.account)
+        if bucket_names is None:
+            bucket_names = self.list_bucket_names()
+            self.cache.set_bucket_names(self.account, bucket_names)
+        records = self.cache.get_records(self.account)
+        now = time.time()
+        stale = [
+            bucket_name
+            for bucket_name in bucket_names
+            if refresh
+            or bucket_name not in records
+            or not self.cache.is_fresh(records[bucket_name].fetched_at, now)
+        ]
+        if stale:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                user_names_future = executor.submit(self.list_user_names)
+                futures = {
+                    executor.submit(self.read_state, bucket_name): bucket_name
+                    for bucket_name in stale
+                }
+                # Records are written as they arrive, so an interrupted scan
+                # keeps what it has read.
+                for future in as_completed(futures):
+                    bucket_name = futures[future]
+                    try:
+                        state = future.result()
+                    except BucketDoesNotExist:
+                        records.pop(bucket_name, None)
+                        self.cache.delete_record(self.account, bucket_name)
+                        continue
+                    except ClientError as e:
+                        # Not cached, so the bucket is read again next time.
+                        records[bucket_name] = BucketRecord(
+                            bucket_name, False, {"error": get_error_code(e)}, now
+                        )
+                        continue
+                    record = BucketRecord(
+                        bucket_name,
+                        self.is_buckup_bucket(
+                            bucket_name, state, user_names_future.result()
+                        ),
+                        state,
+                        time.time(),
+                    )
+                    records[bucket_name] = record
+                    self.cache.set_record(self.account, record)
+        return [records[name] for name in bucket_names if name in records]
@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+
+from .teardown import BucketDestroyer
+from .utils import get_cache_dir
+
+
+class Journal:
+    """
+    The steps of a commit that have completed and their outputs, saved to
+    disk after every step so a failed commit can be resumed without
+    repeating them, or rolled back.
+    """
+
+    def __init__(self, bucket_name, directory=None):
+        self.bucket_name = bucket_name
+        self.path = os.path.join(
+            directory or get_cache_dir("journal"), "{}.json".format(bucket_name)
+        )
+        self.spec = None
+        self.steps = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            self.spec = data["spec"]
+            self.steps = data["steps"]
+
+    @classmethod
+    def list_bucket_names(cls, directory=None):
+        directory = directory or get_cache_dir("journal")
+        return sorted(
+            file_name[: -len(".json")]
+            for file_name in os.listdir(directory)
+            if file_name.endswith(".json")
+        )
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self):
+        data = {"spec": self.spec, "steps": self.steps}
+        # The journal names the user and its keys, so only the owner may
+        # read it.
+        fd = os.open(self.path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def start(self, spec):
+        with self.lock:
+            self.spec = {
+                key: sorted(value) if isinstance(value, (set, frozenset)) else value
+                for key, value in spec.items()
+            }
+            self.save()
+
+    def clear(self):
+        """
+        Forget the recorded steps, when they don't describe what exists.
+        """
+        with self.lock:
+            self.steps = {}
+
+    def record(self, step, outputs=None):
+        with self.lock:
+            self.steps[step] = outputs or {}
+            self.save()
+
+    def is_done(self, step):
+        return step in self.steps
+
+    def get(self, step):
+        return self.steps.get(step)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def rollback(bucket_creator, journal, max_workers=8):
+    """
+    Delete what the journaled commit created: the bucket with everything in
+    it and the user with its keys.
+    """
+    destroyer = BucketDestroyer(bucket_creator, max_workers=max_workers)
+    user = journal.get("create_user")
+    user_name = user["user_name"] if user else ""
+    if journal.is_done("create_bucket"):
+        destroyer.destroy(journal.bucket_name, user_name=user_name)
+    elif user_name:
+        destroyer.delete_user(user_name)
+    journal.delete()
@@ -0,0 +1,177 @@
+import threading
+
+from .tracing import Tracer
+
+# Upper bounds, in seconds, of the latency histogram buckets. Steps that
+# wait for AWS to propagate a change can take a minute or more.
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{name}="{value}"'.format(
+                name=name,
+                value=str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for name, value in labels
+        )
+    )
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for index, bound in enumerate(self.buckets):
+            cumulative += self.counts[index]
+            yield (
+                name + "_bucket",
+                labels + (("le", format_value(bound)),),
+                cumulative,
+            )
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+class Metrics(Tracer):
+    """
+    Tracer that aggregates spans into counters and latency histograms
+    instead of keeping them, so it can run for as long as a server does.
+    ``render()`` returns them in the Prometheus text format.
+
+    Spans are also passed on to ``tracer``, if given.
+    """
+
+    METRICS = {
+        "buckup_step_duration_seconds": (
+            "histogram",
+            "Duration of provisioning steps.",
+        ),
+        "buckup_step_errors_total": ("counter", "Provisioning steps that failed."),
+        "buckup_wait_duration_seconds": (
+            "histogram",
+            "Time spent waiting for AWS to propagate changes.",
+        ),
+        "buckup_wait_retries_total": (
+            "counter",
+            "Retries made while waiting for AWS to propagate changes.",
+        ),
+        "buckup_api_call_duration_seconds": (
+            "histogram",
+            "Duration of AWS API calls.",
+        ),
+        "buckup_api_call_errors_total": ("counter", "AWS API calls that failed."),
+        "buckup_api_call_retries_total": (
+            "counter",
+            "Retries made by botocore for AWS API calls.",
+        ),
+        "buckup_jobs_total": ("counter", "Provisioning jobs by final status."),
+        "buckup_job_duration_seconds": (
+            "histogram",
+            "Duration of provisioning jobs.",
+        ),
+        "buckup_jobs_queued": ("gauge", "Jobs waiting for a worker."),
+        "buckup_jobs_running": ("gauge", "Jobs being provisioned."),
+    }
+
+    def __init__(self, tracer=None, buckets=DEFAULT_BUCKETS):
+        super().__init__()
+        self.tracer = tracer
+        self.histogram_buckets = buckets
+        self.values = {}
+        self.values_lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.values_lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.values_lock:
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.values_lock:
+            histogram = self.values.get(key)
+            if histogram is None:
+                histogram = self.values[key] = Histogram(self.histogram_buckets)
+            histogram.observe(value)
+
+    def add_span(self, span):
+        attributes = span.attributes
+        error = attributes.get("error")
+        if span.category == "step":
+            self.observe("buckup_step_duration_seconds", span.duration, step=span.name)
+            if error:
+                self.increment("buckup_step_errors_total", step=span.name, code=error)
+        elif span.category == "wait":
+            self.observe("buckup_wait_duration_seconds", span.duration, wait=span.name)
+            self.increment(
+                "buckup_wait_retries_total",
+                attributes.get("retries", 0),
+                wait=span.name,
+            )
+        elif span.category == "api":
+            self.observe(
+                "buckup_api_call_duration_seconds", span.duration, operation=span.name
+            )
+            self.increment(
+                "buckup_api_call_retries_total",
+                attributes.get("retries", 0),
+                operation=span.name,
+            )
+            if error:
+                self.increment(
+                    "buckup_api_call_errors_total", operation=span.name, code=error
+                )
+        if self.tracer is not None:
+            self.tracer.add_span(span)
+
+    def render(self):
+        with self.values_lock:
+            samples = {}
+            for (name, labels), value in sorted(
+                self.values.items(), key=lambda item: item[0]
+            ):
+                if isinstance(value, Histogram):
+                    samples.setdefault(name, []).extend(value.samples(name, labels))
+                else:
+                    samples.setdefault(name, []).append((name, labels, value))
+        lines = []
+        for name, (metric_type, description) in self.METRICS.items():
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for sample_name, labels, value in samples.get(name, []):
+                lines.append(
+                    "{}{} {}".format(
+                        sample_name, format_labels(labels), format_value(value)
+                    )
+                )
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,107 @@
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .exceptions import BucketNameAlreadyInUse, InvalidBucketName
+
+BUCKET_NAME_MAX_LENGTH = 63
+BUCKET_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$")
+ENVIRONMENT_SUFFIXES = ("media", "static", "production", "staging", "dev")
+
+
+class BucketNameSuggester:
+    """
+    Find available bucket names close to one that is taken.
+
+    Results of the ``head_bucket`` checks are cached for ``cache_ttl``
+    seconds, so a suggested name can be validated again without another
+    round trip.
+    """
+
+    def __init__(self, bucket_creator, max_workers=8, cache_ttl=60):
+        self.bucket_creator = bucket_creator
+        self.max_workers = max_workers
+        self.cache_ttl = cache_ttl
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+
+    def get_cached(self, bucket_name):
+        with self.cache_lock:
+            try:
+                available, expires_at = self.cache[bucket_name]
+            except KeyError:
+                return None
+            if expires_at < time.monotonic():
+                del self.cache[bucket_name]
+                return None
+            return available
+
+    def set_cached(self, bucket_name, available):
+        with self.cache_lock:
+            self.cache[bucket_name] = (
+                available,
+                time.monotonic() + self.cache_ttl,
+            )
+
+    def validate(self, bucket_name):
+        """
+        Same as ``BucketCreator.validate_bucket_name`` but uses the cache.
+        """
+        available = self.get_cached(bucket_name)
+        if available is None:
+            try:
+                self.bucket_creator.validate_bucket_name(bucket_name)
+            except BucketNameAlreadyInUse:
+                self.set_cached(bucket_name, False)
+                raise
+            self.set_cached(bucket_name, True)
+        elif not available:
+            raise BucketNameAlreadyInUse
+
+    def is_available(self, bucket_name):
+        try:
+            self.validate(bucket_name)
+        except (BucketNameAlreadyInUse, InvalidBucketName):
+            return False
+        return True
+
+    def candidates(self, bucket_name):
+        """
+        Yield valid variants of ``bucket_name``: environment suffixes,
+        numbers and short hashes.
+        """
+        base = re.sub(r"[^a-z0-9.-]+", "-", bucket_name.lower()).strip(".-")
+        suffixes = list(ENVIRONMENT_SUFFIXES)
+        suffixes += [str(number) for number in range(2, 10)]
+        suffixes += [
+            hashlib.sha1("{}-{}".format(bucket_name, number).encode()).hexdigest()[:6]
+            for number in range(5)
+        ]
+        seen = set()
+        for suffix in suffixes:
+            prefix = base[: BUCKET_NAME_MAX_LENGTH - len(suffix) - 1].rstrip(".-")
+            candidate = "{}-{}".format(prefix, suffix)
+            if candidate in seen or not BUCKET_NAME_RE.match(candidate):
+                continue
+            seen.add(candidate)
+            yield candidate
+
+    def suggest(self, bucket_name, count=3):
+        """
+        Return up to ``count`` available names based on ``bucket_name``,
+        checking candidates concurrently.
+        """
+        candidates = list(self.candidates(bucket_name))
+        suggestions = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for start in range(0, len(candidates), self.max_workers):
+                batch = candidates[start : start + self.max_workers]
+                available = list(executor.map(self.is_available, batch))
+                for index, candidate in enumerate(batch):
+                    if available[index]:
+                        suggestions.append(candidate)
+                if len(suggestions) >= count:
+                    break
+        return suggestions[:count]
@@ -0,0 +1,84 @@
+import re
+
+from .exceptions import PolicyTooLarge
+
+# https://docs.aws.amazon.com/AmazonS3/latest/userguide/BucketRestrictions.html
+BUCKET_POLICY_MAX_SIZE = 20 * 1024
+WILDCARDS = "*?"
+
+
+def normalise_path(path):
+    """
+    Strip whitespace, the leading slash and repeated slashes from a path.
+    """
+    return re.sub(r"/{2,}", "/", path.strip()).lstrip("/")
+
+
+def get_literal_prefix(path):
+    """
+    Return the part of the path before its first wildcard.
+    """
+    for index, character in enumerate(path):
+        if character in WILDCARDS:
+            return path[:index]
+    return path
+
+
+class PathTrie:
+    """
+    Character trie of the prefixes of paths ending with a single "*".
+    """
+
+    def __init__(self):
+        self.root = {}
+
+    def add_prefix(self, prefix):
+        node = self.root
+        for character in prefix:
+            node = node.setdefault(character, {})
+        node[None] = True
+
+    def get_covering_prefix(self, path):
+        """
+        Return the shortest prefix in the trie that matches every object
+        ``path`` matches, apart from the path's own prefix.
+        """
+        literal_prefix = get_literal_prefix(path)
+        node = self.root
+        for depth in range(len(literal_prefix) + 1):
+            if None in node and path != literal_prefix[:depth] + "*":
+                return literal_prefix[:depth]
+            if depth == len(literal_prefix):
+                break
+            node = node.get(literal_prefix[depth])
+            if node is None:
+                break
+        return None
+
+
+def compact_paths(paths):
+    """
+    Return the smallest sorted list of paths matching the same objects:
+    paths are normalised, duplicates merged and paths covered by a wildcard
+    prefix (e.g. "docs/2020/*" by "docs/*") dropped.
+    """
+    paths = {normalise_path(path) for path in paths}
+    paths.discard("")
+    trie = PathTrie()
+    for path in paths:
+        if path.endswith("*") and get_literal_prefix(path) == path[:-1]:
+            trie.add_prefix(path[:-1])
+    return sorted(path for path in paths if trie.get_covering_prefix(path) is None)
+
+
+def check_policy_size(policy):
+    """
+    Raise ``PolicyTooLarge`` if the JSON policy is over the size S3 allows.
+    """
+    size = len(policy.encode())
+    if size > BUCKET_POLICY_MAX_SIZE:
+        raise PolicyTooLarge(
+            "The bucket policy is {size} bytes, over the {limit} bytes allowed "
+            "by S3. Use wildcards to cover more public paths with fewer "
+            "entries.".format(size=size, limit=BUCKET_POLICY_MAX_SIZE)
+        )
@@ -0,0 +1,81 @@
+import threading
+
+from . import ratelimit
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+
+
+class ClientPool:
+    """
+    Share boto3 sessions and clients keyed by profile and region.
+
+    Creating a session and loading the service models is slow, so they are
+    created once and reused by every ``BucketCreator`` using the pool.
+    Clients are thread-safe and shared, which also shares their HTTP
+    connection pool and keep-alive connections. Resources are not
+    thread-safe, so every thread gets its own resource objects, bound to the
+    shared client.
+
+    Calls made by every client go through the rate limiter of their
+    service, shared by all pools in the process.
+    """
+
+    def __init__(self, max_pool_connections=None, tracer=None):
+        self.max_pool_connections = max_pool_connections or DEFAULT_MAX_POOL_CONNECTIONS
+        self.tracer = tracer
+        self.sessions = {}
+        self.clients = {}
+        self.resource_classes = {}
+        # Sessions are not thread-safe, so everything created from one is
+        # created under this lock.
+        self.lock = threading.RLock()
+        self.local = threading.local()
+
+    def get_config(self):
+        from botocore.config import Config
+
+        return Config(
+            max_pool_connections=self.max_pool_connections, tcp_keepalive=True
+        )
+
+    def get_session(self, profile_name=None, region_name=None):
+        key = (profile_name, region_name)
+        with self.lock:
+            if key not in self.sessions:
+                import boto3
+
+                session = boto3.session.Session(
+                    profile_name=profile_name, region_name=region_name
+                )
+                # Has to happen before any client is created from the session.
+                ratelimit.attach(session)
+                if self.tracer is not None:
+                    self.tracer.attach(session)
+                self.sessions[key] = session
+            return self.sessions[key]
+
+    def get_client(self, service_name, profile_name=None, region_name=None):
+        key = (profile_name, region_name, service_name)
+        with self.lock:
+            if key not in self.clients:
+                session = self.get_session(profile_name, region_name)
+                self.clients[key] = session.client(
+                    service_name, config=self.get_config()
+                )
+            return self.clients[key]
+
+    def get_resource(self, service_name, profile_name=None, region_name=None):
+        key = (profile_name, region_name, service_name)
+        resources = self.local.__dict__.setdefault("resources", {})
+        if key not in resources:
+            with self.lock:
+                if key not in self.resource_classes:
+                    session = self.get_session(profile_name, region_name)
+                    self.resource_classes[key] = type(
+                        session.resource(service_name, config=self.get_config())
+                    )
+                resource_class = self.resource_classes[key]
+            resources[key] = resource_class(
+                client=self.get_client(service_name, profile_name, region_name)
+            )
+        return resources[key]
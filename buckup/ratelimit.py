@@ -0,0 +1,182 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket allowing ``rate`` calls per second on average, with bursts
+    of up to ``burst`` calls. Safe to share between threads.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("'rate' must be positive.")
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """
+        Take a token, sleeping until one is available.
+        """
+        while True:
+            with self.lock:
+                self.refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    Token bucket whose rate adapts to throttling, like TCP congestion
+    control: every successful call raises the rate a little, by ``increase``
+    calls per second per second at full speed, and a throttling error cuts
+    it by ``decrease``. Throttling errors from calls made before the last
+    cut don't cut it again.
+    """
+
+    def __init__(self, rate, min_rate=1, max_rate=None, increase=2, decrease=0.7):
+        super().__init__(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 10
+        self.increase = increase
+        self.decrease = decrease
+        self.decreased_at = 0
+
+    def set_rate(self, rate):
+        self.refill(time.monotonic())
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.burst = max(1, self.rate)
+        self.tokens = min(self.tokens, self.burst)
+
+    def on_success(self):
+        with self.lock:
+            self.set_rate(self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            now = time.monotonic()
+            # Calls sent in the last second were sent at the old rate.
+            if now - self.decreased_at < 1:
+                return
+            self.decreased_at = now
+            self.set_rate(self.rate * self.decrease)
+
+
+# Error codes AWS returns when requests are sent too fast.
+THROTTLING_ERROR_CODES = frozenset(
+    [
+        "Throttling",
+        "ThrottlingException",
+        "ThrottledException",
+        "RequestLimitExceeded",
+        "RequestThrottled",
+        "RequestThrottledException",
+        "TooManyRequestsException",
+        "SlowDown",
+    ]
+)
+
+# Initial rates, in calls per second, of the services buckup calls. IAM
+# allows far fewer calls than S3.
+DEFAULT_RATES = {"iam": 10, "s3": 100}
+
+# Calls that are not held to the rate of bucket configuration calls: S3
+# allows thousands of object operations and reads per second for every
+# prefix, so limiting them would only slow down transfers, ``reconcile`` and
+# ``inventory``. Only calls that change a bucket share the S3 limiter.
+UNLIMITED_OPERATIONS = {
+    "s3": frozenset(
+        [
+            "AbortMultipartUpload",
+            "CompleteMultipartUpload",
+            "CopyObject",
+            "CreateMultipartUpload",
+            "DeleteObject",
+            "DeleteObjects",
+            "PutObject",
+            "UploadPart",
+            "UploadPartCopy",
+        ]
+    )
+}
+UNLIMITED_OPERATION_PREFIXES = {"s3": ("Get", "Head", "List")}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(service_name):
+    """
+    Return the rate limiter shared by every call to the service made in
+    this process, or ``None`` if calls to the service are not limited.
+    """
+    if service_name not in DEFAULT_RATES:
+        return None
+    with _limiters_lock:
+        if service_name not in _limiters:
+            _limiters[service_name] = AdaptiveRateLimiter(DEFAULT_RATES[service_name])
+        return _limiters[service_name]
+
+
+def set_max_rate(service_name, rate):
+    """
+    Cap the rate of the limiter shared by calls to the service at ``rate``
+    calls per second.
+    """
+    limiter = get_rate_limiter(service_name)
+    with limiter.lock:
+        limiter.max_rate = rate
+        limiter.set_rate(limiter.rate)
+
+
+def get_event_rate_limiter(event_name):
+    """
+    Return the rate limiter of the call an event is about, or ``None`` if
+    the call is not limited.
+    """
+    # Event names look like "before-send.iam.CreateUser".
+    _, service_name, operation_name = event_name.split(".", 2)
+    if operation_name in UNLIMITED_OPERATIONS.get(service_name, ()):
+        return None
+    if operation_name.startswith(UNLIMITED_OPERATION_PREFIXES.get(service_name, ())):
+        return None
+    return get_rate_limiter(service_name)
+
+
+def before_send(event_name, **kwargs):
+    limiter = get_event_rate_limiter(event_name)
+    if limiter is not None:
+        limiter.acquire()
+
+
+def needs_retry(event_name, response=None, **kwargs):
+    limiter = get_event_rate_limiter(event_name)
+    if limiter is None or response is None:
+        return
+    http_response, parsed = response
+    if parsed.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES:
+        limiter.on_throttle()
+    elif http_response.status_code < 500:
+        limiter.on_success()
+
+
+def attach(session):
+    """
+    Make every attempt of the calls made by clients of the session wait
+    for the shared rate limiter of their service, except for the
+    ``UNLIMITED_OPERATIONS``.
+    """
+    # Registered first so that calls wait before any other handler can send
+    # them.
+    session.events.register_first("before-send", before_send)
+    session.events.register("needs-retry", needs_retry)
@@ -0,0 +1,372 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+
+from .batch import BatchResult
+from .bucket_creator import LIFECYCLE_RULE_PREFIX, USER_NAME_FORMAT
+from .exceptions import BucketDoesNotExist, UserDoesNotExist
+from .paths import check_policy_size
+from .steps import StepGraph
+from .tracing import get_error_code
+
+# Order in which changes are shown and the steps they wait for. The public
+# access block has to allow a public policy before it is put.
+SETTINGS = (
+    ("public_access_block", ()),
+    ("policy", ("public_access_block",)),
+    ("cors", ()),
+    ("versioning", ()),
+    ("lifecycle", ()),
+)
+# The lifecycle rule buckup makes for each spec key.
+LIFECYCLE_RULE_IDS = {
+    "noncurrent_version_expiration_days": (
+        LIFECYCLE_RULE_PREFIX + "expire-noncurrent-versions"
+    ),
+    "abort_multipart_upload_days": (
+        LIFECYCLE_RULE_PREFIX + "abort-incomplete-multipart-uploads"
+    ),
+    "intelligent_tiering": LIFECYCLE_RULE_PREFIX + "intelligent-tiering",
+}
+
+
+def normalise_policy(policy):
+    """
+    Return the policy in a form that compares equal to the same policy as
+    returned by S3, which may reorder lists or collapse them to strings.
+    """
+    if policy is None:
+        return None
+
+    def normalise(value):
+        if isinstance(value, list):
+            value = sorted(normalise(item) for item in value)
+            return value[0] if len(value) == 1 else value
+        if isinstance(value, dict):
+            return {key: normalise(item) for key, item in value.items()}
+        return value
+
+    statements = sorted(policy.get("Statement", []), key=lambda s: s.get("Sid", ""))
+    return {
+        "Version": policy.get("Version"),
+        "Statement": [normalise(statement) for statement in statements],
+    }
+
+
+def normalise_cors(cors_rules):
+    if not cors_rules:
+        return None
+    return [
+        {
+            key: sorted(value) if isinstance(value, list) else value
+            for key, value in rule.items()
+            if key != "ID"
+        }
+        for rule in cors_rules
+    ]
+
+
+def normalise_lifecycle(rules):
+    """
+    Return the lifecycle rules sorted by ID, with a rule for the whole
+    bucket always filtered on the empty prefix, as S3 may return it without
+    a filter or with the prefix outside of it.
+    """
+    if not rules:
+        return None
+    normalised = []
+    for rule in rules:
+        rule = dict(rule)
+        if "Prefix" in rule:
+            rule["Filter"] = {"Prefix": rule.pop("Prefix")}
+        if not rule.get("Filter"):
+            rule["Filter"] = {"Prefix": ""}
+        normalised.append(rule)
+    return sorted(normalised, key=lambda rule: rule.get("ID", ""))
+
+
+def get_public_get_object_paths(policy):
+    """
+    Return the paths a normalised policy lets the public read.
+    """
+    paths = []
+    for statement in (policy or {}).get("Statement", []):
+        if statement.get("Sid") != "PublicGetObject":
+            continue
+        resources = statement["Resource"]
+        if not isinstance(resources, list):
+            resources = [resources]
+        # Resources look like "arn:aws:s3:::bucket-name/path".
+        paths.extend(resource.split("/", 1)[1] for resource in resources)
+    return paths
+
+
+class Change:
+    def __init__(self, setting, current, desired):
+        self.setting = setting
+        self.current = current
+        self.desired = desired
+
+    def __str__(self):
+        return "~ {setting}: {current} -> {desired}".format(
+            setting=self.setting,
+            current=json.dumps(self.current, sort_keys=True),
+            desired=json.dumps(self.desired, sort_keys=True),
+        )
+
+
+class Reconciler:
+    """
+    Bring an existing bucket in line with a bucket spec, only making the
+    calls that change something.
+    """
+
+    def __init__(self, bucket_creator):
+        self.bucket_creator = bucket_creator
+
+    @property
+    def s3_client(self):
+        return self.bucket_creator.s3_client
+
+    def read_public_access_block(self, bucket_name):
+        try:
+            response = self.s3_client.get_public_access_block(Bucket=bucket_name)
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchPublicAccessBlockConfiguration":
+                return None
+            raise
+        return response["PublicAccessBlockConfiguration"]
+
+    def read_policy(self, bucket_name):
+        try:
+            response = self.s3_client.get_bucket_policy(Bucket=bucket_name)
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchBucketPolicy":
+                return None
+            raise
+        return normalise_policy(json.loads(response["Policy"]))
+
+    def read_cors(self, bucket_name):
+        try:
+            response = self.s3_client.get_bucket_cors(Bucket=bucket_name)
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchCORSConfiguration":
+                return None
+            raise
+        return normalise_cors(response["CORSRules"])
+
+    def read_versioning(self, bucket_name):
+        response = self.s3_client.get_bucket_versioning(Bucket=bucket_name)
+        return response.get("Status")
+
+    def read_lifecycle(self, bucket_name):
+        try:
+            response = self.s3_client.get_bucket_lifecycle_configuration(
+                Bucket=bucket_name
+            )
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchLifecycleConfiguration":
+                return None
+            raise
+        return normalise_lifecycle(response["Rules"])
+
+    def read_state(self, bucket_name):
+        """
+        Read the current settings of the bucket concurrently.
+        """
+        readers = {
+            "public_access_block": self.read_public_access_block,
+            "policy": self.read_policy,
+            "cors": self.read_cors,
+            "versioning": self.read_versioning,
+            "lifecycle": self.read_lifecycle,
+        }
+        try:
+            with ThreadPoolExecutor(max_workers=len(readers)) as executor:
+                futures = {
+                    setting: executor.submit(reader, bucket_name)
+                    for setting, reader in readers.items()
+                }
+                return {setting: future.result() for setting, future in futures.items()}
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchBucket":
+                raise BucketDoesNotExist(
+                    'Bucket "{}" does not exist.'.format(bucket_name)
+                ) from e
+            raise
+
+    def get_user(self, user_name):
+        user = self.bucket_creator.iam.User(user_name)
+        try:
+            user.load()
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchEntity":
+                raise UserDoesNotExist(
+                    'User "{}" does not exist.'.format(user_name)
+                ) from e
+            raise
+        return user
+
+    def get_desired_state(self, spec, current_state, user):
+        """
+        Return the settings the bucket should have. A setting whose keys are
+        left out of ``spec``, or are ``None``, keeps its current value
+        instead of getting the default of a new bucket.
+        """
+        bucket = self.bucket_creator.s3.Bucket(spec["bucket_name"])
+        public_get_object_paths = spec.get("public_get_object_paths")
+        if public_get_object_paths is None:
+            public_get_object_paths = get_public_get_object_paths(
+                current_state["policy"]
+            )
+        allow_public_acls = spec.get("allow_public_acls")
+        if allow_public_acls is None:
+            allow_public_acls = not (current_state["public_access_block"] or {}).get(
+                "BlockPublicAcls", True
+            )
+        # The policy always gives the user access to the bucket.
+        policy = self.bucket_creator.get_bucket_policy(
+            bucket, user, public_get_object_paths
+        )
+        check_policy_size(json.dumps(policy))
+        desired_state = {
+            "public_access_block": (
+                self.bucket_creator.get_public_access_block_configuration(
+                    allow_public_acls, public_get_object_paths
+                )
+            ),
+            "policy": normalise_policy(policy),
+            "cors": current_state["cors"],
+            "versioning": current_state["versioning"],
+        }
+        if spec.get("cors_origins") is not None:
+            desired_state["cors"] = None
+            if spec["cors_origins"]:
+                desired_state["cors"] = normalise_cors(
+                    self.bucket_creator.get_cors_configuration(spec["cors_origins"])[
+                        "CORSRules"
+                    ]
+                )
+        # Rules that buckup did not create, or that ``spec`` says nothing
+        # about, are left alone.
+        kept_rule_ids = {
+            rule_id
+            for key, rule_id in LIFECYCLE_RULE_IDS.items()
+            if spec.get(key) is None
+        }
+        desired_state["lifecycle"] = normalise_lifecycle(
+            [
+                rule
+                for rule in current_state["lifecycle"] or []
+                if not rule.get("ID", "").startswith(LIFECYCLE_RULE_PREFIX)
+                or rule["ID"] in kept_rule_ids
+            ]
+            + self.bucket_creator.get_lifecycle_rules(
+                spec.get("noncurrent_version_expiration_days"),
+                spec.get("abort_multipart_upload_days"),
+                spec.get("intelligent_tiering"),
+            )
+        )
+        # Versioning can only be suspended once it has been enabled.
+        if spec.get("enable_versioning"):
+            desired_state["versioning"] = "Enabled"
+        elif (
+            spec.get("enable_versioning") is not None
+            and current_state["versioning"] == "Enabled"
+        ):
+            desired_state["versioning"] = "Suspended"
+        return desired_state
+
+    def plan(self, spec):
+        """
+        Return the changes needed for the bucket to match ``spec``.
+        """
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # Loading the user is independent of reading the bucket.
+            user_future = executor.submit(
+                self.get_user,
+                spec.get("user_name")
+                or USER_NAME_FORMAT.format(bucket_name=spec["bucket_name"]),
+            )
+            current_state = self.read_state(spec["bucket_name"])
+            user = user_future.result()
+        desired_state = self.get_desired_state(spec, current_state, user)
+        return [
+            Change(setting, current_state[setting], desired_state[setting])
+            for setting, _ in SETTINGS
+            if current_state[setting] != desired_state[setting]
+        ]
+
+    def apply_change(self, bucket_name, change):
+        if change.setting == "public_access_block":
+            self.s3_client.put_public_access_block(
+                Bucket=bucket_name, PublicAccessBlockConfiguration=change.desired
+            )
+        elif change.setting == "policy":
+            self.s3_client.put_bucket_policy(
+                Bucket=bucket_name, Policy=json.dumps(change.desired)
+            )
+        elif change.setting == "cors":
+            if change.desired is None:
+                self.s3_client.delete_bucket_cors(Bucket=bucket_name)
+            else:
+                self.s3_client.put_bucket_cors(
+                    Bucket=bucket_name,
+                    CORSConfiguration={"CORSRules": change.desired},
+                )
+        elif change.setting == "versioning":
+            self.s3_client.put_bucket_versioning(
+                Bucket=bucket_name,
+                VersioningConfiguration={"Status": change.desired},
+            )
+        elif change.setting == "lifecycle":
+            if change.desired is None:
+                self.s3_client.delete_bucket_lifecycle(Bucket=bucket_name)
+            else:
+                self.s3_client.put_bucket_lifecycle_configuration(
+                    Bucket=bucket_name,
+                    LifecycleConfiguration={"Rules": change.desired},
+                )
+
+    def apply(self, bucket_name, changes):
+        """
+        Make the calls for ``changes``, concurrently where they don't
+        depend on each other.
+        """
+        graph = StepGraph(tracer=self.bucket_creator.tracer, bucket_name=bucket_name)
+        changed = {change.setting: change for change in changes}
+        for setting, requires in SETTINGS:
+            if setting not in changed:
+                continue
+            graph.add(
+                setting,
+                lambda *args, change=changed[setting]: self.apply_change(
+                    bucket_name, change
+                ),
+                requires=[
+                    requirement for requirement in requires if requirement in changed
+                ],
+            )
+        graph.run()
+
+    def reconcile(self, spec, dry_run=False):
+        start = time.monotonic()
+        try:
+            changes = self.plan(spec)
+            if changes and not dry_run:
+                self.apply(spec["bucket_name"], changes)
+        except Exception as e:
+            return BatchResult(spec, error=e, duration=time.monotonic() - start)
+        return BatchResult(spec, result=changes, duration=time.monotonic() - start)
+
+    def run(self, specs, max_workers=4, dry_run=False):
+        """
+        Reconcile every spec, yielding a ``BatchResult`` with the list of
+        changes for each bucket as soon as it is done.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.reconcile, spec, dry_run) for spec in specs]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,141 @@
+import random
+import time
+
+from .exceptions import RetryDeadlineExceeded
+
+
+class Attempt:
+    """
+    A single call made by a ``RetryPolicy``, passed to its ``on_attempt`` hook.
+
+    ``delay`` is how long the policy is going to wait before the next
+    attempt, or ``None`` if there will not be one.
+    """
+
+    def __init__(self, name, number, elapsed, delay=None, error=None):
+        self.name = name
+        self.number = number
+        self.elapsed = elapsed
+        self.delay = delay
+        self.error = error
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def __repr__(self):
+        return (
+            "<Attempt {name} #{number} elapsed={elapsed:.2f}s "
+            "delay={delay} error={error!r}>".format(**vars(self))
+        )
+
+
+class RetryPolicy:
+    """
+    Retry calls that fail while AWS is still propagating a change.
+
+    The first retry happens after ``initial_delay`` seconds and each
+    following delay is ``multiplier`` times longer, up to ``max_delay``.
+    Every delay is randomly shortened by up to ``jitter`` (a fraction of the
+    delay). Once waiting again would go past ``deadline`` seconds since the
+    first attempt, ``RetryDeadlineExceeded`` is raised.
+    """
+
+    def __init__(
+        self,
+        initial_delay=0.5,
+        multiplier=2,
+        max_delay=10,
+        deadline=120,
+        jitter=0.5,
+        on_attempt=None,
+    ):
+        if initial_delay <= 0 or multiplier < 1 or max_delay < initial_delay:
+            raise ValueError("Invalid retry delays.")
+        if not 0 <= jitter < 1:
+            raise ValueError("'jitter' must be between 0 and 1.")
+        self.initial_delay = initial_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.jitter = jitter
+        self.on_attempt = on_attempt
+
+    def delays(self):
+        delay = self.initial_delay
+        while True:
+            yield random.uniform(delay * (1 - self.jitter), delay)
+            delay = min(delay * self.multiplier, self.max_delay)
+
+    def report(self, attempt):
+        if self.on_attempt is not None:
+            self.on_attempt(attempt)
+
+    def get_retry(self, name, number, start, error, delays, retry_if):
+        """
+        Return the ``Attempt`` that failed with ``error``, with the delay
+        before the next one, or raise if it should not be retried.
+        """
+        elapsed = time.monotonic() - start
+        if not retry_if(error):
+            self.report(Attempt(name, number, elapsed, error=error))
+            raise error
+        delay = next(delays)
+        if elapsed + delay > self.deadline:
+            self.report(Attempt(name, number, elapsed, error=error))
+            raise RetryDeadlineExceeded(
+                '"{name}" did not succeed within {deadline}s.'.format(
+                    name=name, deadline=self.deadline
+                )
+            ) from error
+        attempt = Attempt(name, number, elapsed, delay=delay, error=error)
+        self.report(attempt)
+        return attempt
+
+    def call(self, name, func, retry_if, on_retry=None):
+        """
+        Call ``func`` until it succeeds or raises an error for which
+        ``retry_if`` returns false.
+
+        ``on_retry`` is called with the ``Attempt`` before each wait.
+        """
+        start = time.monotonic()
+        delays = self.delays()
+        number = 0
+        while True:
+            number += 1
+            try:
+                result = func()
+            except Exception as e:
+                attempt = self.get_retry(name, number, start, e, delays, retry_if)
+                if on_retry is not None:
+                    on_retry(attempt)
+                time.sleep(attempt.delay)
+            else:
+                self.report(Attempt(name, number, time.monotonic() - start))
+                return result
+
+    async def call_async(self, name, func, retry_if, on_retry=None):
+        """
+        Like ``call``, but awaits the coroutine function ``func`` and waits
+        without blocking the event loop.
+        """
+        # Imported here as asyncio is slow to import and the command line
+        # never needs it.
+        import asyncio
+
+        start = time.monotonic()
+        delays = self.delays()
+        number = 0
+        while True:
+            number += 1
+            try:
+                result = await func()
+            except Exception as e:
+                attempt = self.get_retry(name, number, start, e, delays, retry_if)
+                if on_retry is not None:
+                    on_retry(attempt)
+                await asyncio.sleep(attempt.delay)
+            else:
+                self.report(Attempt(name, number, time.monotonic() - start))
+                return result
@@ -0,0 +1,158 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from botocore.exceptions import ClientError
+
+from . import ratelimit
+from .backends import MAX_ACCESS_KEYS
+from .bucket_creator import USER_NAME_FORMAT
+from .tracing import get_error_code
+
+DEFAULT_RATE = 5
+
+
+class RotationResult:
+    def __init__(
+        self,
+        user_name,
+        access_key_id=None,
+        secret_access_key=None,
+        old_access_key_ids=(),
+        error=None,
+    ):
+        self.user_name = user_name
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.old_access_key_ids = list(old_access_key_ids)
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def as_json(self):
+        if not self.ok:
+            return {"user_name": self.user_name, "error": str(self.error)}
+        return {
+            "user_name": self.user_name,
+            "access_key_id": self.access_key_id,
+            "secret_access_key": self.secret_access_key,
+            "old_access_key_ids": self.old_access_key_ids,
+        }
+
+
+class KeyRotator:
+    """
+    Give IAM users new access keys and retire their old ones, several users
+    at a time. IAM calls are held to at most ``rate`` per second by the
+    rate limiter shared by the process, so that the workers together stay
+    under IAM's request limits.
+    """
+
+    def __init__(self, bucket_creator, max_workers=4, rate=DEFAULT_RATE):
+        self.bucket_creator = bucket_creator
+        self.max_workers = max_workers
+        ratelimit.set_max_rate("iam", rate)
+
+    @property
+    def iam_client(self):
+        return self.bucket_creator.iam.meta.client
+
+    def discover_user_names(self):
+        """
+        Return the names of the users that buckup created for buckets.
+        """
+        suffix = USER_NAME_FORMAT.format(bucket_name="")
+        user_names = []
+        marker = None
+        while True:
+            kwargs = {"Marker": marker} if marker else {}
+            response = self.iam_client.list_users(**kwargs)
+            user_names.extend(
+                user["UserName"]
+                for user in response["Users"]
+                if user["UserName"].endswith(suffix)
+            )
+            if not response.get("IsTruncated"):
+                return sorted(user_names)
+            marker = response["Marker"]
+
+    def list_access_key_ids(self, user_name):
+        response = self.iam_client.list_access_keys(UserName=user_name)
+        return [key["AccessKeyId"] for key in response["AccessKeyMetadata"]]
+
+    def rotate(self, user_name):
+        """
+        Create a new access key for the user, keeping the old ones.
+        """
+        try:
+            old_access_key_ids = self.list_access_key_ids(user_name)
+            if len(old_access_key_ids) >= MAX_ACCESS_KEYS:
+                raise ValueError(
+                    "User already has {} access keys, delete one before "
+                    "rotating.".format(len(old_access_key_ids))
+                )
+            response = self.iam_client.create_access_key(UserName=user_name)
+        except (ClientError, ValueError) as e:
+            return RotationResult(user_name, error=e)
+        return RotationResult(
+            user_name,
+            access_key_id=response["AccessKey"]["AccessKeyId"],
+            secret_access_key=response["AccessKey"]["SecretAccessKey"],
+            old_access_key_ids=old_access_key_ids,
+        )
+
+    def retire(self, result, delete=False):
+        """
+        Deactivate the keys the user had before rotating, and optionally
+        delete them.
+        """
+        for access_key_id in result.old_access_key_ids:
+            try:
+                self.iam_client.update_access_key(
+                    UserName=result.user_name,
+                    AccessKeyId=access_key_id,
+                    Status="Inactive",
+                )
+                if delete:
+                    self.iam_client.delete_access_key(
+                        UserName=result.user_name,
+                        AccessKeyId=access_key_id,
+                    )
+            except ClientError as e:
+                if get_error_code(e) != "NoSuchEntity":
+                    raise
+        return result
+
+    def run(self, user_names):
+        """
+        Rotate the keys of every user, yielding a ``RotationResult`` for each
+        as soon as its new key exists.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self.rotate, user_name) for user_name in user_names
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def retire_all(self, results, grace_period=0, delete=False):
+        """
+        Wait ``grace_period`` seconds for the new keys to be deployed, then
+        retire the old keys of every rotated user. Yields the results whose
+        old keys could not be retired, with the error set.
+        """
+        results = [result for result in results if result.ok]
+        if grace_period:
+            time.sleep(grace_period)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.retire, result, delete): result
+                for result in results
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except ClientError as e:
+                    result = futures[future]
+                    yield RotationResult(result.user_name, error=e)
@@ -0,0 +1,311 @@
+import collections
+import hmac
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .batch import BatchProvisioner, build_spec
+from .exceptions import InvalidManifest
+from .metrics import Metrics
+
+MAX_REQUEST_SIZE = 1024 * 1024
+# Finished jobs kept to be looked up, with their credentials.
+DEFAULT_MAX_FINISHED_JOBS = 1000
+# Keys that read from the server's disk or other buckets, which HTTP clients
+# must not be able to do with the server's credentials.
+LOCAL_SPEC_KEYS = frozenset(
+    [
+        "seed_directory",
+        "seed_concurrency",
+        "seed_part_size",
+        "copy_from",
+        "copy_concurrency",
+    ]
+)
+
+
+class Job:
+    def __init__(self, spec):
+        self.id = uuid.uuid4().hex
+        self.spec = spec
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def bucket_name(self):
+        return self.spec["bucket_name"]
+
+    @property
+    def finished(self):
+        return self.status in ("succeeded", "failed")
+
+    def as_json(self, include_result=True):
+        data = {
+            "id": self.id,
+            "bucket_name": self.bucket_name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error is not None:
+            data["error"] = str(self.error)
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class ProvisioningService:
+    """
+    Queue bucket specs and provision them on a pool of ``max_workers``
+    workers, sharing one ``BatchProvisioner`` and its AWS clients.
+    """
+
+    def __init__(
+        self,
+        provisioner,
+        metrics,
+        max_workers=4,
+        max_finished_jobs=DEFAULT_MAX_FINISHED_JOBS,
+    ):
+        self.provisioner = provisioner
+        self.metrics = metrics
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs = collections.OrderedDict()
+        self.queued = 0
+        self.running = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def submit(self, spec):
+        """
+        Queue ``spec`` and return its ``Job``. Raises ``InvalidManifest`` if
+        the spec is invalid or its bucket is already being provisioned.
+        """
+        local_keys = set(spec) & LOCAL_SPEC_KEYS
+        if local_keys:
+            raise InvalidManifest(
+                "Keys not allowed in a bucket spec sent to the server: {}.".format(
+                    ", ".join(sorted(local_keys))
+                )
+            )
+        spec = build_spec(spec)
+        job = Job(spec)
+        with self.lock:
+            for other in self.jobs.values():
+                if other.bucket_name == job.bucket_name and not other.finished:
+                    raise InvalidManifest(
+                        'Bucket "{}" is already being provisioned.'.format(
+                            job.bucket_name
+                        )
+                    )
+            self.jobs[job.id] = job
+            self.queued += 1
+            self.update_gauges()
+        self.executor.submit(self.run, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def update_gauges(self):
+        self.metrics.set("buckup_jobs_queued", self.queued)
+        self.metrics.set("buckup_jobs_running", self.running)
+
+    def run(self, job):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.update_gauges()
+            job.status = "running"
+            job.started_at = time.time()
+        result = self.provisioner.provision(job.spec)
+        with self.lock:
+            self.running -= 1
+            self.update_gauges()
+            job.finished_at = time.time()
+            if result.ok:
+                job.status = "succeeded"
+                job.result = result.result
+            else:
+                job.status = "failed"
+                job.error = result.error
+            self.forget_finished_jobs()
+        self.metrics.increment("buckup_jobs_total", status=job.status)
+        self.metrics.observe("buckup_job_duration_seconds", result.duration)
+
+    def forget_finished_jobs(self):
+        finished = [job.id for job in self.jobs.values() if job.finished]
+        for job_id in finished[: max(len(finished) - self.max_finished_jobs, 0)]:
+            del self.jobs[job_id]
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of a ``ProvisioningService``:
+
+    - ``POST /jobs`` with a bucket spec queues it and returns the job.
+    - ``GET /jobs`` lists the jobs, without their credentials.
+    - ``GET /jobs/<id>`` returns a job, with the credentials once it
+      succeeded.
+    - ``GET /metrics`` returns the metrics in the Prometheus text format.
+    - ``GET /health`` returns 200 while the server is up.
+    """
+
+    server_version = "buckup"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):  # noqa: A002
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        # Responses can contain secret keys.
+        self.send_header("Cache-Control", "no-store")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {"error": message})
+
+    def is_authorized(self):
+        if not self.server.token:
+            return True
+        expected = "Bearer {}".format(self.server.token)
+        return hmac.compare_digest(
+            self.headers.get("Authorization", "").encode(), expected.encode()
+        )
+
+    def do_GET(self):  # noqa: N802
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+            return
+        if self.path == "/metrics":
+            body = self.service.metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if not self.is_authorized():
+            self.send_error_json(401, "Missing or invalid token.")
+            return
+        if self.path == "/jobs":
+            self.send_json(
+                200,
+                {
+                    "jobs": [
+                        job.as_json(include_result=False) for job in self.service.list()
+                    ]
+                },
+            )
+            return
+        if self.path.startswith("/jobs/"):
+            job = self.service.get(self.path[len("/jobs/") :])
+            if job is None:
+                self.send_error_json(404, "No such job.")
+                return
+            self.send_json(200, job.as_json())
+            return
+        self.send_error_json(404, "Not found.")
+
+    def do_POST(self):  # noqa: N802
+        if self.path != "/jobs":
+            self.send_error_json(404, "Not found.")
+            return
+        if not self.is_authorized():
+            self.send_error_json(401, "Missing or invalid token.")
+            return
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self.send_error_json(411, "Content-Length is required.")
+            return
+        # int() would also accept signs, underscores and non-ASCII digits.
+        if not (length.isascii() and length.isdigit()):
+            self.send_error_json(400, "Invalid Content-Length.")
+            return
+        length = int(length)
+        if length > MAX_REQUEST_SIZE:
+            self.send_error_json(413, "Request too large.")
+            return
+        try:
+            spec = json.loads(self.rfile.read(length) or b"null")
+        except ValueError as e:
+            self.send_error_json(400, "Invalid JSON: {}".format(e))
+            return
+        if isinstance(spec, str):
+            spec = {"bucket_name": spec}
+        if not isinstance(spec, dict):
+            self.send_error_json(400, "The body must be a bucket spec.")
+            return
+        try:
+            job = self.service.submit(spec)
+        except InvalidManifest as e:
+            self.send_error_json(400, str(e))
+            return
+        self.send_json(
+            202, job.as_json(), headers=[("Location", "/jobs/{}".format(job.id))]
+        )
+
+
+class ProvisioningServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, token=None, quiet=False):
+        super().__init__(address, ServiceRequestHandler)
+        self.service = service
+        self.token = token
+        self.quiet = quiet
+
+
+def create_server(
+    host="127.0.0.1",
+    port=8080,
+    profile_name=None,
+    region_name=None,
+    max_workers=4,
+    retry_policy=None,
+    tracer=None,
+    user_pool=None,
+    token=None,
+    quiet=False,
+):
+    """
+    Return a ``ProvisioningServer`` ready to ``serve_forever()``.
+    """
+    metrics = Metrics(tracer=tracer)
+    provisioner = BatchProvisioner(
+        profile_name=profile_name,
+        region_name=region_name,
+        max_workers=max_workers,
+        retry_policy=retry_policy,
+        tracer=metrics,
+        user_pool=user_pool,
+    )
+    service = ProvisioningService(provisioner, metrics, max_workers=max_workers)
+    return ProvisioningServer((host, port), service, token=token, quiet=quiet)
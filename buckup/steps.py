@@ -0,0 +1,145 @@
+import functools
+import inspect
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .tracing import NullTracer
+
+
+class StepGraph:
+    """
+    Run named steps in parallel as soon as the steps they require are done.
+
+    Each step is called with the results of the steps it requires, in the
+    order they were listed. Every step is recorded as a span of ``tracer``,
+    and ``on_step`` is called with its name and result once it succeeds.
+
+    Steps are functions, or coroutine functions when the graph is run with
+    ``run_async()``.
+    """
+
+    def __init__(self, tracer=None, on_step=None, **span_attributes):
+        self.steps = {}
+        self.tracer = tracer or NullTracer()
+        self.on_step = on_step
+        self.span_attributes = span_attributes
+
+    def add(self, name, func, requires=()):
+        if name in self.steps:
+            raise ValueError('Step "{}" is already defined.'.format(name))
+        for requirement in requires:
+            if requirement not in self.steps:
+                raise ValueError(
+                    'Step "{name}" requires unknown step "{requirement}".'.format(
+                        name=name, requirement=requirement
+                    )
+                )
+        self.steps[name] = (func, tuple(requires))
+
+    def pop_ready(self, pending, results):
+        """
+        Remove the steps whose requirements are done from ``pending`` and
+        yield them with their arguments.
+        """
+        for name, (func, requires) in list(pending.items()):
+            if all(requirement in results for requirement in requires):
+                del pending[name]
+                yield name, func, [results[requirement] for requirement in requires]
+
+    def call(self, name, func, *args):
+        with self.tracer.span(name, category="step", **self.span_attributes):
+            result = func(*args)
+        if self.on_step is not None:
+            self.on_step(name, result)
+        return result
+
+    def run(self):
+        """
+        Run every step and return a mapping of step names to their results.
+
+        If a step fails, no further steps are started and the first error
+        is raised once the running steps have finished.
+        """
+        results = {}
+        pending = dict(self.steps)
+        running = {}
+        error = None
+        if not pending:
+            return results
+        with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+            while pending or running:
+                if error is None:
+                    for name, func, args in self.pop_ready(pending, results):
+                        future = executor.submit(self.call, name, func, *args)
+                        running[future] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+        if error is not None:
+            raise error
+        return results
+
+    async def call_async(self, name, func, args, loop, executor):
+        with self.tracer.span(name, category="step", **self.span_attributes):
+            if inspect.iscoroutinefunction(func):
+                result = await func(*args)
+            else:
+                result = await loop.run_in_executor(
+                    executor, functools.partial(func, *args)
+                )
+        if self.on_step is not None:
+            self.on_step(name, result)
+        return result
+
+    async def run_async(self, executor=None):
+        """
+        Like ``run()``, on the running event loop. Coroutine functions are
+        awaited and other steps run on ``executor``, or on the loop's default
+        executor.
+
+        If a step fails, the running steps are awaited before the error is
+        raised. If the run is cancelled, they are cancelled too.
+        """
+        # Imported here, as only asyncio applications run graphs on an
+        # event loop.
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        results = {}
+        pending = dict(self.steps)
+        running = {}
+        error = None
+        try:
+            while pending or running:
+                if error is None:
+                    for name, func, args in self.pop_ready(pending, results):
+                        task = asyncio.ensure_future(
+                            self.call_async(name, func, args, loop, executor)
+                        )
+                        running[task] = name
+                if not running:
+                    break
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        results[name] = task.result()
+                    except Exception as e:
+                        if error is None:
+                            error = e
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+        if error is not None:
+            raise error
+        return results
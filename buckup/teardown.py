@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+from .bucket_creator import USER_NAME_FORMAT
+from .exceptions import BucketDoesNotExist
+from .steps import StepGraph
+from .tracing import get_error_code
+from .utils import iter_bounded
+
+# Maximum number of keys accepted by DeleteObjects.
+DELETE_BATCH_SIZE = 1000
+
+
+class BucketDestroyer:
+    """
+    Delete a bucket with all its object versions, and the user created for
+    it.
+
+    Object versions are listed page by page and deleted in batches by a pool
+    of workers, with a bounded number of batches in memory at any time.
+    """
+
+    def __init__(self, bucket_creator, max_workers=8):
+        self.bucket_creator = bucket_creator
+        self.max_workers = max_workers
+
+    @property
+    def s3_client(self):
+        return self.bucket_creator.s3_client
+
+    @property
+    def iam_client(self):
+        return self.bucket_creator.iam.meta.client
+
+    def iter_version_batches(self, bucket_name):
+        """
+        Yield lists of up to ``DELETE_BATCH_SIZE`` object versions and delete
+        markers.
+        """
+        paginator = self.s3_client.get_paginator("list_object_versions")
+        batch = []
+        for page in paginator.paginate(
+            Bucket=bucket_name, PaginationConfig={"PageSize": DELETE_BATCH_SIZE}
+        ):
+            for version in page.get("Versions", []) + page.get("DeleteMarkers", []):
+                batch.append({"Key": version["Key"], "VersionId": version["VersionId"]})
+                if len(batch) == DELETE_BATCH_SIZE:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def delete_batch(self, bucket_name, objects):
+        response = self.s3_client.delete_objects(
+            Bucket=bucket_name, Delete={"Objects": objects, "Quiet": True}
+        )
+        errors = response.get("Errors", [])
+        if errors:
+            raise RuntimeError(
+                'Could not delete {count} objects from "{bucket_name}", e.g. '
+                '"{key}": {message}'.format(
+                    count=len(errors),
+                    bucket_name=bucket_name,
+                    key=errors[0]["Key"],
+                    message=errors[0]["Message"],
+                )
+            )
+        return len(objects)
+
+    def delete_versions(self, bucket_name):
+        """
+        Make one pass over the object versions, deleting them as they are
+        listed, and return how many were deleted.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return sum(
+                iter_bounded(
+                    executor,
+                    lambda objects: self.delete_batch(bucket_name, objects),
+                    self.iter_version_batches(bucket_name),
+                    # Stops the listing from running ahead of the deletes.
+                    max_in_flight=self.max_workers * 2,
+                )
+            )
+
+    def empty_bucket(self, bucket_name):
+        """
+        Delete every object version and delete marker, returning how many
+        were deleted.
+        """
+        deleted = 0
+        try:
+            # Objects written while the bucket is being emptied are picked up
+            # by another pass.
+            while True:
+                deleted_in_pass = self.delete_versions(bucket_name)
+                if not deleted_in_pass:
+                    break
+                deleted += deleted_in_pass
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchBucket":
+                raise BucketDoesNotExist(
+                    'Bucket "{}" does not exist.'.format(bucket_name)
+                ) from e
+            raise
+        self.bucket_creator.echo(
+            'Deleted {deleted} object versions from "{bucket_name}".'.format(
+                deleted=deleted, bucket_name=bucket_name
+            )
+        )
+        return deleted
+
+    def delete_bucket_policy(self, bucket_name):
+        self.s3_client.delete_bucket_policy(Bucket=bucket_name)
+        self.bucket_creator.echo(
+            'Deleted the policy of bucket "{}".'.format(bucket_name)
+        )
+
+    def delete_bucket(self, bucket_name):
+        self.s3_client.delete_bucket(Bucket=bucket_name)
+        self.bucket_creator.echo('Deleted bucket "{}".'.format(bucket_name))
+
+    def delete_user(self, user_name):
+        """
+        Delete the user with its access keys and policies. Returns ``False``
+        if the user does not exist.
+        """
+        try:
+            for page in self.iam_client.get_paginator("list_access_keys").paginate(
+                UserName=user_name
+            ):
+                for access_key in page["AccessKeyMetadata"]:
+                    self.iam_client.delete_access_key(
+                        UserName=user_name, AccessKeyId=access_key["AccessKeyId"]
+                    )
+            # Older versions of buckup gave the user an inline owner policy.
+            for page in self.iam_client.get_paginator("list_user_policies").paginate(
+                UserName=user_name
+            ):
+                for policy_name in page["PolicyNames"]:
+                    self.iam_client.delete_user_policy(
+                        UserName=user_name, PolicyName=policy_name
+                    )
+            for page in self.iam_client.get_paginator(
+                "list_attached_user_policies"
+            ).paginate(UserName=user_name):
+                for policy in page["AttachedPolicies"]:
+                    self.iam_client.detach_user_policy(
+                        UserName=user_name, PolicyArn=policy["PolicyArn"]
+                    )
+            self.iam_client.delete_user(UserName=user_name)
+        except ClientError as e:
+            if get_error_code(e) == "NoSuchEntity":
+                self.bucket_creator.echo(
+                    'User "{}" does not exist, skipped.'.format(user_name)
+                )
+                return False
+            raise
+        self.bucket_creator.echo('Deleted IAM user "{}".'.format(user_name))
+        return True
+
+    def destroy(self, bucket_name, user_name=None):
+        """
+        Delete the bucket and its user (by default the one buckup would
+        have created for it, pass an empty ``user_name`` to keep it).
+        """
+        if user_name is None:
+            user_name = USER_NAME_FORMAT.format(bucket_name=bucket_name)
+        # Check the bucket name before deleting anything, including the user.
+        try:
+            self.s3_client.head_bucket(Bucket=bucket_name)
+        except ClientError as e:
+            if get_error_code(e) in ("404", "NoSuchBucket"):
+                raise BucketDoesNotExist(
+                    'Bucket "{}" does not exist.'.format(bucket_name)
+                ) from e
+            raise
+        graph = StepGraph(tracer=self.bucket_creator.tracer, bucket_name=bucket_name)
+        graph.add("empty_bucket", lambda: self.empty_bucket(bucket_name))
+        # The policy and the user are only removed once the bucket is empty,
+        # so a bucket that can't be emptied keeps its owner and its policy.
+        graph.add(
+            "delete_bucket_policy",
+            lambda *args: self.delete_bucket_policy(bucket_name),
+            requires=["empty_bucket"],
+        )
+        graph.add(
+            "delete_bucket",
+            lambda *args: self.delete_bucket(bucket_name),
+            requires=["empty_bucket", "delete_bucket_policy"],
+        )
+        if user_name:
+            graph.add(
+                "delete_user",
+                lambda *args: self.delete_user(user_name),
+                requires=["empty_bucket"],
+            )
+        return graph.run()
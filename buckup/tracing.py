@@ -0,0 +1,163 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    def __init__(self, name, category, start, attributes=None):
+        self.name = name
+        self.category = category
+        self.start = start
+        self.duration = None
+        self.thread_id = threading.get_ident()
+        self.attributes = attributes or {}
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "category": self.category,
+            "start": self.start,
+            "duration": self.duration,
+            "thread_id": self.thread_id,
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """
+    Record how long each provisioning step and each AWS API call takes.
+
+    Steps are recorded with ``span()``. API calls are recorded by attaching
+    the tracer to a boto3 session with ``attach()`` before any clients are
+    created from it.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self.origin = time.time()
+        self.lock = threading.Lock()
+        self.sessions = set()
+
+    def now(self):
+        return time.time() - self.origin
+
+    def add_span(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, name, category="step", **attributes):
+        span = Span(name, category, self.now(), attributes)
+        try:
+            yield span
+        except Exception as e:
+            span.attributes["error"] = get_error_code(e)
+            raise
+        finally:
+            span.duration = self.now() - span.start
+            self.add_span(span)
+
+    def attach(self, session):
+        with self.lock:
+            if id(session) in self.sessions:
+                return
+            self.sessions.add(id(session))
+        session.events.register("before-parameter-build", self.before_parameter_build)
+        session.events.register("before-call", self.before_call)
+        session.events.register("after-call", self.after_call)
+        session.events.register("after-call-error", self.after_call_error)
+
+    def before_parameter_build(self, params, context, **kwargs):
+        context["buckup_trace_attributes"] = {
+            param: params[param] for param in ("Bucket", "UserName") if param in params
+        }
+
+    def before_call(self, model, context, **kwargs):
+        context["buckup_trace_span"] = Span(
+            "{}.{}".format(model.service_model.service_name, model.name),
+            "api",
+            self.now(),
+            dict(context.get("buckup_trace_attributes", {})),
+        )
+
+    def after_call(self, http_response, parsed, context, **kwargs):
+        span = context.pop("buckup_trace_span", None)
+        if span is None:
+            return
+        metadata = parsed.get("ResponseMetadata", {})
+        span.attributes["retries"] = metadata.get("RetryAttempts", 0)
+        span.attributes["status"] = metadata.get(
+            "HTTPStatusCode", getattr(http_response, "status_code", None)
+        )
+        if "Error" in parsed:
+            span.attributes["error"] = parsed["Error"].get("Code")
+        span.duration = self.now() - span.start
+        self.add_span(span)
+
+    def after_call_error(self, exception, context, **kwargs):
+        span = context.pop("buckup_trace_span", None)
+        if span is None:
+            return
+        span.attributes["error"] = type(exception).__name__
+        span.duration = self.now() - span.start
+        self.add_span(span)
+
+    def as_json(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {"spans": [span.as_dict() for span in spans]}
+
+    def as_chrome_trace(self):
+        """
+        Return the spans in the Chrome trace event format, which can be
+        opened in chrome://tracing or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        with self.lock:
+            spans = list(self.spans)
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round(span.start * 1e6),
+                    "dur": round(span.duration * 1e6),
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": span.attributes,
+                }
+                for span in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, path, output_format="json"):
+        if output_format == "chrome":
+            trace = self.as_chrome_trace()
+        else:
+            trace = self.as_json()
+        with open(path, "w") as f:
+            json.dump(trace, f, indent=2, default=str)
+
+
+class NullTracer:
+    """
+    Tracer used when tracing is off.
+    """
+
+    @contextlib.contextmanager
+    def span(self, name, category="step", **attributes):
+        yield Span(name, category, 0, attributes)
+
+    def attach(self, session):
+        pass
+
+
+def get_error_code(error):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return type(error).__name__
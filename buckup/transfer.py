@@ -0,0 +1,253 @@
+import hashlib
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import get_cache_dir, iter_bounded
+
+MB = 1024 * 1024
+DEFAULT_PART_SIZE = 8 * MB
+HASH_CHUNK_SIZE = 1 * MB
+# Object metadata where the SHA-256 of uploaded files is stored, since the
+# ETag of multipart uploads is not a hash of the content.
+SHA256_METADATA_KEY = "sha256"
+
+
+def get_file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class TransferReport:
+    def __init__(self):
+        self.transferred = 0
+        self.skipped = 0
+        self.bytes = 0
+        self.duration = 0
+
+    def as_json(self):
+        return {
+            "transferred": self.transferred,
+            "skipped": self.skipped,
+            "bytes": self.bytes,
+            "duration": self.duration,
+        }
+
+    def __str__(self):
+        duration = self.duration or 1e-9
+        return (
+            "{transferred} objects ({megabytes:.1f} MB) in {duration:.1f}s, "
+            "{mb_per_second:.1f} MB/s, {objects_per_second:.1f} objects/s, "
+            "{skipped} skipped".format(
+                transferred=self.transferred,
+                megabytes=self.bytes / MB,
+                duration=self.duration,
+                mb_per_second=self.bytes / MB / duration,
+                objects_per_second=self.transferred / duration,
+                skipped=self.skipped,
+            )
+        )
+
+
+class DirectoryUploader:
+    """
+    Upload a local directory tree into a bucket.
+
+    Files are streamed from disk by a shared transfer manager, using
+    multipart uploads of ``part_size`` bytes for large files, with up to
+    ``max_workers`` requests at a time. Files already in the bucket with the
+    same size and SHA-256 are skipped.
+    """
+
+    def __init__(self, s3_client, max_workers=10, part_size=DEFAULT_PART_SIZE):
+        self.s3_client = s3_client
+        self.max_workers = max_workers
+        self.part_size = part_size
+
+    def iter_files(self, directory):
+        """
+        Yield the path and the object key of every file in the directory.
+        """
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for file_name in sorted(files):
+                path = os.path.join(root, file_name)
+                key = os.path.relpath(path, directory).replace(os.sep, "/")
+                yield path, key
+
+    def list_existing(self, bucket_name):
+        existing = {}
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket_name):
+            for obj in page.get("Contents", []):
+                existing[obj["Key"]] = obj["Size"]
+        return existing
+
+    def is_uploaded(self, bucket_name, key, size, sha256, existing):
+        if existing.get(key) != size:
+            return False
+        response = self.s3_client.head_object(Bucket=bucket_name, Key=key)
+        return response.get("Metadata", {}).get(SHA256_METADATA_KEY) == sha256
+
+    def upload(self, bucket_name, directory):
+        """
+        Upload the directory and return a ``TransferReport``.
+        """
+        from boto3.s3.transfer import TransferConfig, create_transfer_manager
+
+        if not os.path.isdir(directory):
+            raise ValueError('"{}" is not a directory.'.format(directory))
+        config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.max_workers,
+        )
+        report = TransferReport()
+        start = time.monotonic()
+        existing = self.list_existing(bucket_name)
+
+        with create_transfer_manager(self.s3_client, config) as manager:
+
+            def upload_file(path, key):
+                size = os.path.getsize(path)
+                sha256 = get_file_sha256(path)
+                if self.is_uploaded(bucket_name, key, size, sha256, existing):
+                    return None
+                extra_args = {"Metadata": {SHA256_METADATA_KEY: sha256}}
+                content_type, _ = mimetypes.guess_type(path)
+                if content_type:
+                    extra_args["ContentType"] = content_type
+                manager.upload(path, bucket_name, key, extra_args=extra_args).result()
+                return size
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for size in iter_bounded(
+                    executor,
+                    lambda item: upload_file(*item),
+                    self.iter_files(directory),
+                    max_in_flight=self.max_workers * 2,
+                ):
+                    if size is None:
+                        report.skipped += 1
+                    else:
+                        report.transferred += 1
+                        report.bytes += size
+        report.duration = time.monotonic() - start
+        return report
+
+
+def parse_bucket_path(value):
+    """
+    Split "bucket/prefix" into the bucket name and the prefix.
+    """
+    bucket_name, _, prefix = value.partition("/")
+    if not bucket_name:
+        raise ValueError('"{}" does not start with a bucket name.'.format(value))
+    return bucket_name, prefix
+
+
+class BucketCopier:
+    """
+    Copy objects from another bucket server-side, without downloading them.
+
+    The source is listed page by page and objects are copied by a shared
+    transfer manager, with multipart copies for large objects. The key of
+    the last object copied, with every key before it also copied, is saved
+    as a checkpoint, so an interrupted copy resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        max_workers=10,
+        part_size=DEFAULT_PART_SIZE,
+        checkpoint_interval=100,
+    ):
+        self.s3_client = s3_client
+        self.max_workers = max_workers
+        self.part_size = part_size
+        self.checkpoint_interval = checkpoint_interval
+
+    def get_checkpoint_path(self, source, bucket_name):
+        file_name = hashlib.sha256(
+            "{}\n{}".format(source, bucket_name).encode()
+        ).hexdigest()[:16]
+        return os.path.join(get_cache_dir("copy"), "{}.json".format(file_name))
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)["last_key"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def write_checkpoint(self, path, source, bucket_name, last_key):
+        # Written to a temporary file first so a crash can't leave it corrupt.
+        with open(path + ".tmp", "w") as f:
+            json.dump(
+                {"source": source, "bucket_name": bucket_name, "last_key": last_key},
+                f,
+            )
+        os.replace(path + ".tmp", path)
+
+    def iter_source_objects(self, source_bucket, prefix, start_after=None):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        kwargs = {"Bucket": source_bucket, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        for page in paginator.paginate(**kwargs):
+            for obj in page.get("Contents", []):
+                yield obj
+
+    def copy(self, source, bucket_name):
+        """
+        Copy every object under ``source`` ("bucket/prefix") into the bucket
+        and return a ``TransferReport``.
+        """
+        from boto3.s3.transfer import TransferConfig, create_transfer_manager
+
+        source_bucket, prefix = parse_bucket_path(source)
+        checkpoint_path = self.get_checkpoint_path(source, bucket_name)
+        last_key = self.read_checkpoint(checkpoint_path)
+        config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.max_workers,
+        )
+        report = TransferReport()
+        start = time.monotonic()
+
+        with create_transfer_manager(self.s3_client, config) as manager:
+
+            def copy_object(obj):
+                manager.copy(
+                    {"Bucket": source_bucket, "Key": obj["Key"]},
+                    bucket_name,
+                    obj["Key"],
+                ).result()
+                return obj
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                # Results come back in listing order, so every key up to the
+                # last one returned has been copied.
+                for obj in iter_bounded(
+                    executor,
+                    copy_object,
+                    self.iter_source_objects(source_bucket, prefix, last_key),
+                    max_in_flight=self.max_workers * 2,
+                ):
+                    report.transferred += 1
+                    report.bytes += obj["Size"]
+                    if report.transferred % self.checkpoint_interval == 0:
+                        self.write_checkpoint(
+                            checkpoint_path, source, bucket_name, obj["Key"]
+                        )
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        report.duration = time.monotonic() - start
+        return report
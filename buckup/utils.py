@@ -1,3 +1,7 @@
+import collections
+import os
+
+
 class CommandLineInterface:
     def ask(self, question):
         return input("{}\n>>> ".format(question))
@@ -22,3 +26,30 @@ class CommandLineInterface:
         elif answer.lower() == "n":
             return False
         return self.ask_yes_no(question, default=default)
+
+
+def iter_bounded(executor, func, items, max_in_flight):
+    """
+    Call ``func`` with each item on the executor and yield the results in
+    order, without submitting more than ``max_in_flight`` calls ahead, so
+    ``items`` can be a generator over any number of items.
+    """
+    futures = collections.deque()
+    for item in items:
+        if len(futures) >= max_in_flight:
+            yield futures.popleft().result()
+        futures.append(executor.submit(func, item))
+    while futures:
+        yield futures.popleft().result()
+
+
+def get_cache_dir(*parts):
+    """
+    Return a directory under buckup's cache directory, creating it if needed.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    path = os.path.join(cache_home, "buckup", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
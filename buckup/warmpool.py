@@ -0,0 +1,296 @@
+import functools
+import json
+import secrets
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+from .backends import User
+from .bucket_creator import is_bucket_not_found, is_invalid_principal, is_user_not_found
+
+# Spares are kept under their own IAM path so they can be found again by
+# later runs and are never mistaken for users in use.
+SPARE_USER_PATH = "/buckup/spare/"
+SPARE_USER_NAME_FORMAT = "buckup-spare-{token}"
+# Empty bucket whose policy S3 must accept with a spare as the principal
+# before the spare is used.
+PROBE_BUCKET_NAME_FORMAT = "buckup-spare-probe-{token}"
+
+
+def get_probe_policy(bucket_name, user):
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Sid": "ProbeSpareUser",
+                "Effect": "Deny",
+                "Principal": {"AWS": user.arn},
+                "Action": "s3:GetObject",
+                "Resource": "arn:aws:s3:::{}/*".format(bucket_name),
+            }
+        ],
+    }
+
+
+class WarmUserPool:
+    """
+    Keep ``size`` spare IAM users created ahead of time, so that
+    ``BucketCreator`` can claim one that AWS has already propagated instead
+    of waiting for a new user to become usable.
+
+    A spare is only used once S3 accepts it as a policy principal on a
+    probe bucket, an empty bucket kept between runs. Spares live in IAM, so
+    the ones left over by a run are used by the next, once probed again. A
+    claimed spare is renamed to the user name that was asked for and, if
+    ``replace`` is true, a replacement is created in the background.
+    """
+
+    def __init__(self, bucket_creator, size=5, max_workers=2, replace=True):
+        if size < 1:
+            raise ValueError("'size' must be at least 1.")
+        self.bucket_creator = bucket_creator
+        self.size = size
+        self.replace = replace
+        self.spares = deque()
+        self.pending = 0
+        self.futures = set()
+        self.lock = threading.Lock()
+        # Notified when a spare is added and when loading ends.
+        self.ready = threading.Condition(self.lock)
+        self.loading = False
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.closed = False
+        self.probe_bucket_name = None
+        self.probe_bucket_lock = threading.Lock()
+
+    @property
+    def backend(self):
+        return self.bucket_creator.backend
+
+    def start(self):
+        """
+        Probe the spares left by earlier runs, and create the missing ones if
+        ``replace`` is true, in the background. ``claim`` waits until the
+        spares left by earlier runs are probed.
+        """
+        with self.lock:
+            self.loading = True
+
+        def load():
+            try:
+                self.load()
+            except Exception as e:
+                self.bucket_creator.echo("Cannot load spare users: {}".format(e))
+
+        threading.Thread(target=load, daemon=True).start()
+        return self
+
+    def fill(self):
+        """
+        Create the missing spares and wait until they are all usable.
+        """
+        self.load()
+        while True:
+            with self.lock:
+                futures = set(self.futures)
+            if not futures:
+                return len(self.spares)
+            wait(futures)
+
+    def close(self):
+        """
+        Stop creating and probing spares. Calls already sent are left to
+        finish, but nothing is retried.
+        """
+        with self.lock:
+            self.closed = True
+            self.ready.notify_all()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, func):
+        with self.lock:
+            if self.closed:
+                return None
+            future = self.executor.submit(func)
+            self.futures.add(future)
+
+        def done(future):
+            with self.lock:
+                self.futures.discard(future)
+
+        future.add_done_callback(done)
+        return future
+
+    def load(self):
+        with self.lock:
+            self.loading = True
+        try:
+            users = self.backend.list_users(SPARE_USER_PATH)
+            with self.lock:
+                known = {spare.name for spare in self.spares}
+                users = [user for user in users if user.name not in known]
+                self.pending += len(users)
+            futures = []
+            for user in users:
+                future = self.submit(functools.partial(self.add_spare, user))
+                if future is None:
+                    with self.lock:
+                        self.pending -= 1
+                else:
+                    futures.append(future)
+            self.refill()
+            wait(futures)
+        finally:
+            with self.lock:
+                self.loading = False
+                self.ready.notify_all()
+
+    def refill(self):
+        with self.lock:
+            if self.closed or not self.replace:
+                return
+            missing = max(self.size - len(self.spares) - self.pending, 0)
+            self.pending += missing
+        for _ in range(missing):
+            if self.submit(self.create_spare) is None:
+                with self.lock:
+                    self.pending -= 1
+
+    def is_probe_bucket_name(self, bucket_name):
+        return bucket_name.startswith(PROBE_BUCKET_NAME_FORMAT.format(token=""))
+
+    def get_probe_bucket_name(self):
+        """
+        Return the probe bucket left by an earlier run, or create one.
+        """
+        with self.probe_bucket_lock:
+            if self.probe_bucket_name is not None:
+                return self.probe_bucket_name
+            bucket_names = sorted(
+                bucket_name
+                for bucket_name in self.backend.list_buckets()
+                if self.is_probe_bucket_name(bucket_name)
+            )
+            if bucket_names:
+                self.probe_bucket_name = bucket_names[0]
+                return self.probe_bucket_name
+            bucket_name = PROBE_BUCKET_NAME_FORMAT.format(token=secrets.token_hex(6))
+            self.backend.create_bucket(
+                bucket_name, self.backend.region_name or "us-east-1"
+            )
+            self.bucket_creator.retry(
+                "wait_probe_bucket_exists",
+                lambda: self.backend.head_bucket(bucket_name),
+                retry_if=is_bucket_not_found,
+            )
+            self.probe_bucket_name = bucket_name
+            return bucket_name
+
+    def create_spare(self):
+        user_name = SPARE_USER_NAME_FORMAT.format(token=secrets.token_hex(6))
+        try:
+            user = self.backend.create_user(user_name, path=SPARE_USER_PATH)
+        except Exception as e:
+            self.bucket_creator.echo(
+                'Cannot create spare user "{user_name}": {error}'.format(
+                    user_name=user_name, error=e
+                )
+            )
+            with self.lock:
+                self.pending -= 1
+            return
+        self.add_spare(user)
+
+    def add_spare(self, user):
+        """
+        Wait until IAM finds ``user`` and S3 accepts it as a principal, then
+        make it a spare.
+        """
+        try:
+            self.bucket_creator.retry(
+                "wait_spare_user_exists",
+                lambda: self.backend.get_user(user.name),
+                retry_if=lambda e: is_user_not_found(e) and not self.closed,
+            )
+            bucket_name = self.get_probe_bucket_name()
+            policy = json.dumps(get_probe_policy(bucket_name, user))
+            self.bucket_creator.retry(
+                "wait_spare_user_principal",
+                lambda: self.backend.put_bucket_policy(bucket_name, policy),
+                retry_if=lambda e: is_invalid_principal(e) and not self.closed,
+            )
+        except Exception as e:
+            if not self.closed:
+                self.bucket_creator.echo(
+                    'Cannot probe spare user "{user_name}": {error}'.format(
+                        user_name=user.name, error=e
+                    )
+                )
+            # The spare is probed again by the next ``load``.
+            user = None
+        finally:
+            with self.lock:
+                self.pending -= 1
+                if user is not None:
+                    self.spares.append(user)
+                    self.ready.notify_all()
+
+    def claim(self, user_name):
+        """
+        Rename a spare to ``user_name`` and return it, or return ``None`` if
+        there is no spare left. Waits for a spare while the ones left by
+        earlier runs are being probed.
+        """
+        try:
+            while True:
+                with self.lock:
+                    self.ready.wait_for(
+                        lambda: self.spares or not self.loading or self.closed
+                    )
+                    if not self.spares:
+                        return None
+                    spare = self.spares.popleft()
+                try:
+                    self.backend.update_user(spare.name, user_name, new_path="/")
+                except ClientError as e:
+                    # Another process claimed it since it was listed.
+                    if is_user_not_found(e):
+                        continue
+                    with self.lock:
+                        self.spares.appendleft(spare)
+                    raise
+                account_arn = spare.arn.split(":user/", 1)[0]
+                return User(user_name, "{}:user/{}".format(account_arn, user_name))
+        finally:
+            self.refill()
+
+    def drain(self):
+        """
+        Delete every spare and probe bucket, including the ones left by
+        earlier runs.
+        """
+        with self.lock:
+            self.spares.clear()
+        users = self.backend.list_users(SPARE_USER_PATH)
+        for user in users:
+            try:
+                self.backend.delete_user(user.name)
+            except ClientError as e:
+                if not is_user_not_found(e):
+                    raise
+        with self.probe_bucket_lock:
+            self.probe_bucket_name = None
+            for bucket_name in self.backend.list_buckets():
+                if not self.is_probe_bucket_name(bucket_name):
+                    continue
+                try:
+                    self.backend.delete_bucket(bucket_name)
+                except ClientError as e:
+                    if not is_bucket_not_found(e):
+                        raise
+                self.bucket_creator.echo(
+                    'Deleted probe bucket "{}".'.format(bucket_name)
+                )
+        return len(users)